@@ -6,7 +6,11 @@ import pymysql
 import numpy as np
 import pandas as pd
 import datetime as dtt
-from database import Data
+import os
+from collections import OrderedDict
+from database import Data, add_months
+from cost import CostModel, FixedFee
+from pool import ConnectionPool
 
 
 class Order(object):
@@ -19,26 +23,215 @@ class Order(object):
         self.is_buy = is_buy
 
 
-def fee(order: Order):
-    return 0.003 * order.volume
+class PanelBlock(object):
+    """价格面板中的一个年度数据块，dts为排序后的日期序列，symbols为品种到列号的字典，values为字段×日期×品种的三维矩阵"""
+    __slots__ = ("dts", "symbols", "values")
+
+    def __init__(self, dts, symbols, values):
+        self.dts = dts
+        self.symbols = symbols
+        self.values = values
+
+
+class PricePanel(object):
+    """将tb_sec中的中债估值（dirty、net、yield）按年度整块读入内存，以日期×品种的稠密矩阵存储，取价时只做数组切片，
+    内存中最多保留max_blocks个年度数据块，超出时淘汰最久未使用的数据块"""
+    fields = ("dirty", "net", "yield")
+
+    def __init__(self, cur, max_blocks=3, shared=None):
+        """shared为覆盖全部日期的只读数据块（例如由from_file以内存映射方式载入），给定时不再访问数据库"""
+        self.cur = cur
+        self.max_blocks = max_blocks
+        self.blocks = OrderedDict()
+        self.shared = shared
+
+    def load_block(self, year):
+        """一次性读取某一年度的全部估值数据并构建成矩阵，缺失的价格以nan表示"""
+        sql = r"select dt, code0, dirty, net, yield from tb_sec where dt >= %s and dt < %s"
+        data = Data(sql, self.cur, (dtt.date(year, 1, 1), dtt.date(year + 1, 1, 1)))
+        # 估值按float64读取，与sql模式逐笔取价的结果保持一致
+        dts, codes, *prices = data.columns(dict.fromkeys(self.fields, "float64"))
+        dt_index, i = np.unique(dts, return_inverse=True)
+        symbols, j = np.asarray(codes.categories, dtype=str), codes.codes
+        values = np.full((len(self.fields), len(dt_index), len(symbols)), np.nan)
+        # tb_sec中同一首发债在同一天可能对应多只续发债，其估值相同，重复赋值不影响结果
+        values[:, i, j] = prices
+        return PanelBlock(dt_index, {s: k for k, s in enumerate(symbols)}, values)
+
+    def block(self, year):
+        """按最近最少使用原则获取年度数据块"""
+        if self.shared is not None:
+            return self.shared
+        if year in self.blocks:
+            self.blocks.move_to_end(year)
+        else:
+            self.blocks[year] = self.load_block(year)
+            while self.max_blocks is not None and len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        return self.blocks[year]
+
+    def get_price(self, dt, symbol, field="dirty"):
+        """提取单个品种在单个日期上的价格，dt可以是date、datetime或日期字符串"""
+        dt64 = np.datetime64(dt, "D")
+        block = self.block(dt64.astype(object).year)
+        i = np.searchsorted(block.dts, dt64)
+        j = block.symbols.get(symbol)
+        if j is None or i == len(block.dts) or block.dts[i] != dt64:
+            raise ValueError("未从数据库中查找到所需价格信息，日期：{}、品种：{}".format(dt, symbol))
+        return block.values[self.fields.index(field), i, j]
+
+    def get_prices(self, symbols, dt1, dt2, field="dirty"):
+        """提取多个品种在[dt1, dt2)区间内的价格矩阵，行表示品种，列表示日期，同时返回日期序列"""
+        k = self.fields.index(field)
+        dt1_64, dt2_64 = np.datetime64(dt1, "D"), np.datetime64(dt2, "D")
+        prices, dts = [], []
+        last = None
+        for year in range(dt1.year, dt2.year + 1):
+            block = self.block(year)
+            if block is last:
+                continue
+            last = block
+            a, b = np.searchsorted(block.dts, [dt1_64, dt2_64])
+            price = np.full((len(symbols), b - a), np.nan)
+            for m, symbol in enumerate(symbols):
+                j = block.symbols.get(symbol)
+                if j is not None:
+                    price[m] = block.values[k, a:b, j]
+            prices.append(price)
+            dts.extend(block.dts[a:b].astype(object))
+        return np.concatenate(prices, axis=1), dts
+
+    def dump(self, path, year1, year2):
+        """将year1至year2年度的数据块合并为一个数据块，以npy文件写入path目录，供其他进程以内存映射方式只读共享"""
+        blocks = [self.block(year) for year in range(year1, year2 + 1)]
+        dts = np.concatenate([b.dts for b in blocks])
+        symbols = sorted(set().union(*[b.symbols for b in blocks]))
+        index = {s: k for k, s in enumerate(symbols)}
+        values = np.full((len(self.fields), len(dts), len(symbols)), np.nan)
+        a = 0
+        for b in blocks:
+            cols = [index[s] for s in b.symbols]
+            values[:, a:a + len(b.dts), cols] = b.values[:, :, list(b.symbols.values())]
+            a += len(b.dts)
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "dts.npy"), dts)
+        np.save(os.path.join(path, "symbols.npy"), np.array(symbols))
+        np.save(os.path.join(path, "values.npy"), values)
+
+    @classmethod
+    def from_file(cls, path):
+        """以内存映射方式只读载入dump写出的价格面板，多个进程共享同一份物理内存"""
+        dts = np.load(os.path.join(path, "dts.npy"))
+        symbols = np.load(os.path.join(path, "symbols.npy"))
+        values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+        return cls(None, shared=PanelBlock(dts, {s: k for k, s in enumerate(symbols.tolist())}, values))
+
+
+class CouponCalendar(object):
+    """付息日历，由payment表（到期日与票面利率）与tb_pri表（发行日与年付息次数）一次性生成每只债券的全部付息日与
+    兑付日，按日期排序存为数组，区间查询使用二分查找，因此与区间长度无关"""
+    def __init__(self, cur, par=100):
+        self.par = par
+        self.dates = {}  # 债券代码->付息日数组
+        self.flows = {}  # 债券代码->每张现金流数组，最后一次包含本金
+        sql = r"""select t1.code, t1.pmdt, t1.rate, t2.dt, t2.pay_times from payment t1 left join tb_pri t2
+        on t1.code = t2.code"""
+        for code, pmdt, rate, dt0, pay_times in Data(sql, cur).data:
+            if pmdt is None or rate is None:
+                continue
+            self.add(code, pmdt, rate, dt0, pay_times or 1)
+
+    def add(self, code, pmdt, rate, dt0=None, freq=1):
+        """从到期日pmdt向前按付息间隔推算付息日，直至发行日dt0（不含），dt0未知时最多推算50年"""
+        months = 12 // freq
+        if dt0 is None:
+            dt0 = add_months(pmdt, -12 * 50)
+        dates = []
+        k = 0
+        dt = pmdt
+        while dt > dt0:
+            dates.append(dt)
+            k += 1
+            dt = add_months(pmdt, -months * k)
+        dates.reverse()
+        flows = np.full(len(dates), rate / freq)
+        flows[-1] += self.par
+        self.dates[code] = np.array(dates, dtype="datetime64[D]")
+        self.flows[code] = flows
+
+    def events(self, codes, time1, time2):
+        """返回codes在(time1, time2]之间的付息与兑付事件，按日期排序"""
+        t = np.array([time1, time2], dtype="datetime64[D]")
+        res = []
+        for code in codes:
+            dates = self.dates.get(code)
+            if dates is None:
+                continue
+            a, b = np.searchsorted(dates, t, side="right")
+            for i in range(a, b):
+                res.append([code, dates[i].astype(object), self.flows[code][i], i == len(dates) - 1])
+        res.sort(key=lambda r: r[1])
+        return res
 
 
 class MarketData(object):
-    """用于获取指令单以及持仓的市场价格数据"""
-    def __init__(self, cur: pymysql.cursors.Cursor):
+    """用于获取指令单以及持仓的市场价格数据，mode为"sql"时每次取价均查询数据库，mode为"panel"时使用预先载入内存的
+    价格面板（PricePanel），max_blocks为面板在内存中保留的年度数据块个数，也可直接传入已构建的panel与calendar"""
+    def __init__(self, cur: pymysql.cursors.Cursor, mode="sql", max_blocks=3, panel=None, calendar=None):
         self.cur = cur
+        self.calendar = calendar
+        self.terms = {}  # 品种->期限
+        if panel is not None:
+            self.panel = panel
+        elif mode == "panel":
+            self.panel = PricePanel(cur, max_blocks)
+        elif mode == "sql":
+            self.panel = None
+        else:
+            raise ValueError("不被接受的参数值mode")
 
     def get_order_price(self, order:Order, field="dirty"):
         """从数据库中提取订单产品的价格数据，其中order表示订单，field表示价格类型，即数据库表的字段名，默认为债券全价"""
+        if self.panel is not None:
+            return self.panel.get_price(order.time, order.symbol, field)
         sql = r"select {} from tb_sec where dt = %s and code0 = %s".format(field)
         _ = self.cur.execute(sql, (order.time, order.symbol))
         price = self.cur.fetchone()[0]
         return price
 
+    def get_order_prices(self, orders, field="dirty"):
+        """一次性提取一组指令单的价格，返回与orders顺序一致的数组。指令单时间可以是date、datetime或日期字符串，
+        与get_order_price相同按日期取价"""
+        if self.panel is not None:
+            return np.array([self.panel.get_price(o.time, o.symbol, field) for o in orders], dtype=float)
+        times = np.array([np.datetime64(o.time, "D") for o in orders])
+        symbols = list(set(o.symbol for o in orders))
+        sql = r"select distinct dt, code0, {} from tb_sec where dt >= %s and dt <= %s and code0 in %s".format(field)
+        data = Data(sql, self.cur, (times.min().astype(object), times.max().astype(object), symbols)).data
+        price = {(np.datetime64(d[0], "D"), d[1]): d[2] for d in data}
+        res = np.empty(len(orders))
+        for i, o in enumerate(orders):
+            p = price.get((times[i], o.symbol))
+            if p is None:
+                raise ValueError("未从数据库中查找到所需价格信息，日期：{}、品种：{}".format(o.time, o.symbol))
+            res[i] = p
+        return res
+
+    def get_terms(self, symbols):
+        """返回与symbols顺序一致的债券期限数组，期限只从数据库查询一次后缓存"""
+        missing = list(set(symbols) - set(self.terms))
+        if missing:
+            sql = r"select distinct code0, term from tb_sec where code0 in %s"
+            self.terms.update(Data(sql, self.cur, (missing,)).data)
+        return np.array([self.terms.get(s, np.nan) for s in symbols], dtype=float)
+
     def get_position_price(self, ps:dict, dt1, dt2):
         """根据持仓从数据库中提取相应的价格数据,以矩阵形式返回结果，行表示品种，列表示日期，参数ps表示字典，键为品种，值
         为持仓量，dt1表示开始日期，dt2表示结束日期，价格序列包含开始日期而不包含结束日期"""
         symbols = ps.keys()
+        if self.panel is not None:
+            prices, dts = self.panel.get_prices(list(symbols), dt1, dt2)
+            return (np.matrix(prices) if symbols else None), dts
         price_list = []
         sql = r"""select distinct dirty from tb_sec where dt >= %s and dt < %s and code0 = %s order by dt"""
         for symbol in symbols:
@@ -51,6 +244,24 @@ class MarketData(object):
                    (dt1, dt2)).select_col(0)
         return prices, dts
 
+    def get_price_matrix(self, symbols, dt1, dt2, field="dirty"):
+        """一次性提取多个品种在[dt1, dt2)区间内的价格，以矩阵形式返回，行表示日期，列表示品种，缺失值为nan，
+        同时返回日期序列"""
+        if self.panel is not None:
+            prices, dts = self.panel.get_prices(list(symbols), dt1, dt2, field)
+            return prices.T, dts
+        dts = Data("select distinct dt from tb_sec where dt >= %s and dt < %s order by dt", self.cur,
+                   (dt1, dt2)).select_col(0)
+        prices = np.full((len(dts), len(symbols)), np.nan)
+        if symbols and dts:
+            sql = r"select distinct dt, code0, {} from tb_sec where dt >= %s and dt < %s and code0 in %s".format(field)
+            data = Data(sql, self.cur, (dt1, dt2, list(symbols)))
+            dt, code, price = data.columns({field: "float64"})
+            i = np.searchsorted(np.array(dts, dtype="datetime64[D]"), dt)
+            j = pd.Index(symbols).get_indexer(code)
+            prices[i, j] = price
+        return prices, dts
+
     def get_last_position_value(self, cash, ps, dt):
         """对于持仓最后一天的持仓市值的计算，get_position_price无能为力，因此特别编制本方法来处理"""
         symbols = ps.keys()
@@ -58,7 +269,10 @@ class MarketData(object):
             price_list = []
             sql = r"""select distinct dirty from tb_sec where dt = %s and code0 = %s"""
             for symbol in symbols:
-                price_list.append(Data(sql, self.cur, (dt, symbol)).select_col(0))
+                if self.panel is not None:
+                    price_list.append([self.panel.get_price(dt, symbol)])
+                else:
+                    price_list.append(Data(sql, self.cur, (dt, symbol)).select_col(0))
             if price_list:
                 prices = np.matrix(price_list, dtype=float)
             else:
@@ -72,108 +286,274 @@ class MarketData(object):
         else:
             return pd.DataFrame([[cash, 0, cash]], index=pd.to_datetime([dt]), columns=["cash", "asset", "total"])
 
+    def get_calendar(self):
+        """返回付息日历，首次调用时从数据库构建"""
+        if self.calendar is None:
+            self.calendar = CouponCalendar(self.cur)
+        return self.calendar
+
     def get_paymentdt(self, codes, time1, time2):
-        """根据持仓债券代码查询到期日期，以及付息额,如果存在付息情况，则返回结果中包含债券代码与付息额"""
-        res = []
+        """根据持仓债券代码查询(time1, time2]之间的付息与兑付事件，返回按日期排序的[债券代码，日期，每张现金流，
+        是否兑付]列表，兑付事件的现金流包含本金"""
+        if time1 > time2:
+            raise ValueError("time1应当小于time2")
         if codes:
-            sql = r"select * from payment where code in %s"
-            data = Data(sql, self.cur, (codes,)).data
-            for d in data:
-                if time1.year == time2.year:
-                    dt = dtt.date(time1.year, d[1].month, d[1].day)
-                    if time1 < dt <= time2:
-                        res.append([d[0], dt, d[2]])
-                elif time1.year < time2.year:
-                    delta_year = time2.year - time1.year
-                    if delta_year == 1:
-                        if d[1].month > time1.month:
-                            dt = dtt.date(time1.year, d[1].month, d[1].day)
-                            res.append([d[0], dt, d[2]])
-                            if d[1].month < time2.month:
-                                dt = dtt.date(time2.year, d[1].month, d[1].day)
-                                res.append([d[0], dt, d[2]])
-                        elif d[1].month < time2.month:
-                            dt = dtt.date(time2.year, d[1].month, d[1].day)
-                            res.append([d[0], dt, d[2]])
-                        elif d[1].month == time1.month:
-                            if d[1].day > time1.day:
-                                dt = dtt.date(time1.year, d[1].month, d[1].day)
-                                res.append([d[0], dt, d[2]])
-                        elif d[1].month == time2.month:
-                            if d[1].day <= time2.day:
-                                dt = dtt.date(time2.year, d[1].month, d[1].day)
-                                res.append([d[0], dt, d[2]])
-                    else:
-                        pass # delta_year的年限超过1年已超出本项目的需要，因此虽然有考虑这种情况但是不做处理
-                else:
-                    raise ValueError("time1应当小于time2")
+            return self.get_calendar().events(codes, time1, time2)
+        return []
+
+
+class Ledger(object):
+    """本类用紧凑的事件账本记录持仓变化，每个事件包括时间与事件后的现金，持仓变化以（事件序号，品种序号，数量变化）
+    的形式记入增量日志，各数组预先分配并按倍数扩容，追加记录的平摊复杂度为O(1)，仅在需要时才生成DataFrame"""
+    def __init__(self, capacity=1024):
+        self.n = 0  # 事件个数
+        self.times = np.empty(capacity, dtype="datetime64[D]")
+        self.cash = np.empty(capacity)
+        self.m = 0  # 持仓变动记录个数
+        self.event_ids = np.empty(capacity, dtype=np.int64)
+        self.symbol_ids = np.empty(capacity, dtype=np.int64)
+        self.volumes = np.empty(capacity)
+        self.symbols = []
+        self.symbol_index = {}
+        self.cache = np.zeros((0, 0))  # 持仓矩阵的缓存，预先分配，有效部分为前rows行
+        self.rows = 0  # 缓存中已累计的事件个数
+        self.applied = 0  # 缓存中已累计的持仓变动记录个数
+
+    @staticmethod
+    def grow(arr, size):
+        """将数组扩容至不小于size，容量按倍数增长"""
+        if size <= len(arr):
+            return arr
+        res = np.empty(max(size, 2 * len(arr)), dtype=arr.dtype)
+        res[:len(arr)] = arr
         return res
 
+    def symbol_id(self, symbol):
+        """返回品种对应的序号，新品种自动分配序号"""
+        i = self.symbol_index.get(symbol)
+        if i is None:
+            i = self.symbol_index[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return i
+
+    def record(self, time, cash, deltas=()):
+        """记录一个事件，time为事件时间，cash为事件后的现金，deltas为（品种，数量变化）的序列"""
+        self.times = self.grow(self.times, self.n + 1)
+        self.cash = self.grow(self.cash, self.n + 1)
+        self.times[self.n] = np.datetime64(time, "D")
+        self.cash[self.n] = cash
+        for symbol, volume in deltas:
+            size = self.m + 1
+            self.event_ids = self.grow(self.event_ids, size)
+            self.symbol_ids = self.grow(self.symbol_ids, size)
+            self.volumes = self.grow(self.volumes, size)
+            self.event_ids[self.m] = self.n
+            self.symbol_ids[self.m] = self.symbol_id(symbol)
+            self.volumes[self.m] = volume
+            self.m += 1
+        self.n += 1
+
+    def holdings(self):
+        """返回事件×品种的持仓矩阵（只读），第i行表示第i个事件之后的持仓。矩阵缓存在按倍数扩容的数组中，每次调用只
+        累计上次调用之后新增的事件与持仓变动，新品种的列在之前的事件中为0"""
+        r, s = self.rows, len(self.symbols)
+        if self.n > self.cache.shape[0] or s > self.cache.shape[1]:
+            cache = np.zeros((max(self.n, 2 * self.cache.shape[0]), max(s, 2 * self.cache.shape[1])))
+            cache[:r, :self.cache.shape[1]] = self.cache[:r]
+            self.cache = cache
+        if self.n > r:
+            # 新增持仓变动的事件序号均不小于r
+            new = self.cache[r:self.n, :s]
+            new[:] = 0
+            k = slice(self.applied, self.m)
+            np.add.at(new, (self.event_ids[k] - r, self.symbol_ids[k]), self.volumes[k])
+            if r:
+                new[0] += self.cache[r - 1, :s]
+            np.cumsum(new, axis=0, out=new)
+            self.rows, self.applied = self.n, self.m
+        res = self.cache[:self.n, :s]
+        res.flags.writeable = False
+        return res
+
+    def state(self):
+        """以数组字典的形式返回账本的有效部分，用于保存检查点"""
+        return {"times": self.times[:self.n], "cash": self.cash[:self.n], "event_ids": self.event_ids[:self.m],
+                "symbol_ids": self.symbol_ids[:self.m], "volumes": self.volumes[:self.m],
+                "symbols": np.array(self.symbols, dtype=str)}
+
+    @classmethod
+    def from_state(cls, state):
+        """由state恢复账本"""
+        ledger = cls(max(len(state["times"]), len(state["volumes"]), 1))
+        ledger.n = len(state["times"])
+        ledger.m = len(state["volumes"])
+        ledger.times[:ledger.n] = state["times"]
+        ledger.cash[:ledger.n] = state["cash"]
+        ledger.event_ids[:ledger.m] = state["event_ids"]
+        ledger.symbol_ids[:ledger.m] = state["symbol_ids"]
+        ledger.volumes[:ledger.m] = state["volumes"]
+        for symbol in state["symbols"].tolist():
+            ledger.symbol_id(symbol)
+        return ledger
+
+    def to_frame(self):
+        """生成与原有position格式一致的DataFrame，index为时间，cash为现金，ps为字典形式的持仓"""
+        ps = [{self.symbols[j]: h[j] for j in np.flatnonzero(h)} for h in self.holdings()]
+        return pd.DataFrame({"cash": self.cash[:self.n], "ps": ps}, index=pd.to_datetime(self.times[:self.n]),
+                            columns=["cash", "ps"])
+
 
 class Position(object):
     """本类用于记录持仓信息，接受order与相应的市场价格自动计算账户的现金以及持仓，用字典记录持仓，
-    用DataFrame存储cash与持仓"""
-    def __init__(self, cash, ps, time, market:MarketData):
-        """利用初始持仓cash与ps初始化，cash表示初始现金，ps是字典形式的初始持仓，单位为张，time为时间"""
+    用事件账本（Ledger）存储cash与持仓的变化"""
+    def __init__(self, cash, ps, time, market:MarketData, cost:CostModel=None):
+        """利用初始持仓cash与ps初始化，cash表示初始现金，ps是字典形式的初始持仓，单位为张，time为时间，
+        cost为交易成本模型（见cost.py），默认为每张0.003元的固定费用"""
         self.cash = cash
         self.ps = ps.copy()
         self.time = time
-        self.position = pd.DataFrame([[cash, ps]], pd.to_datetime([time]), columns=["cash", "ps"])
+        self.ledger = Ledger()
+        self.ledger.record(time, cash, ps.items())
         self.market = market
+        self.cost = cost or FixedFee()
+
+    @property
+    def position(self):
+        """以DataFrame形式返回历史的cash与持仓"""
+        return self.ledger.to_frame()
+
+    def snapshot(self):
+        """以数组字典的形式返回账户当前状态（现金、持仓、时间与账本），用于保存检查点"""
+        state = {"ledger_" + k: v for k, v in self.ledger.state().items()}
+        state["cash"] = np.array(self.cash)
+        state["time"] = np.array(self.time, dtype="datetime64[D]")
+        state["ps_symbols"] = np.array(list(self.ps), dtype=str)
+        state["ps_volumes"] = np.array(list(self.ps.values()), dtype=float)
+        return state
+
+    @classmethod
+    def restore(cls, state, market: MarketData, cost: CostModel=None):
+        """由snapshot返回的状态恢复账户"""
+        position = cls.__new__(cls)
+        position.cash = float(state["cash"])
+        position.time = state["time"].item()
+        position.ps = dict(zip(state["ps_symbols"].tolist(), state["ps_volumes"].tolist()))
+        position.ledger = Ledger.from_state({k[7:]: v for k, v in state.items() if k.startswith("ledger_")})
+        position.market = market
+        position.cost = cost or FixedFee()
+        return position
 
     def check_payment(self, order: Order):
-        """在接受指令单之前，需要检查持仓的债券资产是否有付息以及兑付情况"""
+        """在接受指令单之前，需要检查持仓的债券资产是否有付息以及兑付情况，兑付后该债券从持仓中移除"""
         if self.ps:
             res = self.market.get_paymentdt(list(self.ps.keys()), self.time, order.time)
-            if res:
-                for r in res:
-                    self.cash += r[2] * self.ps[r[0]]
-                    self.time = r[1]
-                    self.position = self.position.append(pd.DataFrame([[self.cash, self.ps.copy()]],
-                                                                      pd.to_datetime([self.time]),
-                                                                      columns=["cash", "ps"]))
+            for code, dt, flow, redeemed in res:
+                self.receive(code, dt, flow, redeemed)
 
-    def get_order(self, order:Order):
-        """接受指令单，自动生成交易指令执行后的持仓数据，写入position"""
-        dirty = self.market.get_order_price(order)
-        # 在接受新的指令单前需要先检查在上次指令单之后是否发生了付息事件
-        self.check_payment(order)
+    def receive(self, code, dt, flow, redeemed=False):
+        """收取持仓债券code在dt日的每张现金流flow，兑付时（redeemed为True）将该债券从持仓中移除"""
+        volume = self.ps[code]
+        self.cash += flow * volume
+        self.time = dt
+        if redeemed:
+            del self.ps[code]
+            self.ledger.record(self.time, self.cash, [(code, -volume)])
+        else:
+            self.ledger.record(self.time, self.cash)
+
+    def costs(self, orders, prices):
+        """按成本模型批量计算指令单的成交价与交易费用，prices为估值价格"""
+        volume = np.array([o.volume for o in orders], dtype=float)
+        is_buy = np.array([o.is_buy for o in orders], dtype=bool)
+        term = self.market.get_terms([o.symbol for o in orders]) if self.cost.needs_term else None
+        return self.cost(prices, volume, is_buy, term)
+
+    def fill(self, order: Order, dirty):
+        """以估值价格dirty成交指令单，成交价与费用由成本模型给出"""
+        price, cost = self.costs([order], [dirty])
+        self.execute(order, price[0], cost[0])
+
+    def execute(self, order: Order, price, cost):
+        """以成交价price与费用cost成交指令单，更新现金与持仓并写入账本"""
         if self.time > order.time:
             raise ValueError("新的指令单时间{}应当晚于上一次指令单时间{}".format(order.time, self.time))
         if order.is_buy:
-            self.cash -= (dirty * order.volume + fee(order))
+            self.cash -= (price * order.volume + cost)
             if self.cash < 0:
                 raise ValueError("账户现金不够,指令单：{}".format(order.time))
             else:
                 self.ps[order.symbol] = self.ps.get(order.symbol, 0) + order.volume
                 self.time = order.time
-                self.position = self.position.append(pd.DataFrame([[self.cash, self.ps.copy()]],
-                                                                  pd.to_datetime([self.time]), columns=["cash", "ps"]))
+                self.ledger.record(self.time, self.cash, [(order.symbol, order.volume)])
                 # print("指令成交")
         else:
             if order.symbol not in self.ps or order.volume > self.ps[order.symbol]:
                 raise ValueError("{}无可用持仓或持仓不足，指令时间：{}".format(order.symbol, order.time))
             else:
-                self.cash += (dirty * order.volume - fee(order))
+                self.cash += (price * order.volume - cost)
                 self.ps[order.symbol] -= order.volume
                 if self.ps[order.symbol] == 0:
                     del self.ps[order.symbol]
                 self.time = order.time
-                self.position = self.position.append(pd.DataFrame([[self.cash, self.ps.copy()]],
-                                                                  pd.to_datetime([self.time]), columns=["cash", "ps"]))
+                self.ledger.record(self.time, self.cash, [(order.symbol, -order.volume)])
                 # print("指令成交")
 
+    def get_order(self, order:Order):
+        """接受指令单，自动生成交易指令执行后的持仓数据，写入position"""
+        dirty = self.market.get_order_price(order)
+        # 在接受新的指令单前需要先检查在上次指令单之后是否发生了付息事件
+        self.check_payment(order)
+        self.fill(order, dirty)
+
+    def get_orders(self, orders):
+        """批量接受按时间排序的指令单，价格只查询一次，成交价与费用由成本模型一次算出，付息事件由内存中的付息日历
+        给出，效果与依次调用get_order相同"""
+        if not len(orders):
+            return
+        prices, costs = self.costs(orders, self.market.get_order_prices(orders))
+        for order, price, cost in zip(orders, prices, costs):
+            self.check_payment(order)
+            self.execute(order, price, cost)
+
     def get_value(self):
-        """根据self.position计算连续时间上的账户资产价值，包括现金（cash), 其他资产（asset)及其总和(total),结果以
-        DataFrame形式呈现"""
-        res = pd.DataFrame(columns=["cash", "asset", "total"])
-        dts = [dt.date() for dt in self.position.index]
+        """根据账本一次性计算连续时间上的账户资产价值，包括现金（cash), 其他资产（asset)及其总和(total),结果以
+        DataFrame形式呈现。先将账本展开为日期×品种的持仓矩阵（每个交易日沿用当日及之前最后一个事件后的持仓），
+        再与同形状的价格矩阵逐元素相乘"""
+        ledger = self.ledger
+        times = ledger.times[:ledger.n]
+        dt1 = times[0].astype(object)
+        dt2 = times[-1].astype(object)
+        prices, dts = self.market.get_price_matrix(ledger.symbols, dt1, dt2 + dtt.timedelta(1))
+        if not dts or dts[-1] != dt2:
+            raise ValueError("未从数据库中查找到所需价格信息，日期：{}".format(dt2))
+        holdings, cash = self.get_holdings(dts)
+        asset = np.where(holdings != 0, holdings * prices, 0).sum(axis=1)
+        return pd.DataFrame({"cash": cash, "asset": asset, "total": cash + asset}, index=pd.to_datetime(dts),
+                            columns=["cash", "asset", "total"])
+
+    def get_holdings(self, dts):
+        """返回账户在日期序列dts上的持仓矩阵（日期×品种，列顺序同ledger.symbols）与现金数组，每日沿用当日及之前
+        最后一个事件后的状态，早于初始时间的日期持仓为0，现金为初始现金"""
+        ledger = self.ledger
+        idx = np.searchsorted(ledger.times[:ledger.n], np.array(dts, dtype="datetime64[D]"), side="right") - 1
+        before = idx < 0
+        idx = np.maximum(idx, 0)
+        holdings, cash = ledger.holdings()[idx], ledger.cash[idx]
+        holdings[before] = 0
+        cash[before] = ledger.cash[0]
+        return holdings, cash
+
+    def get_value_loop(self):
+        """逐段计算账户资产价值的原始实现，与get_value结果一致，保留用于核对与性能比较"""
+        res = []
+        position = self.position
+        dts = [dt.date() for dt in position.index]
         for i in range(len(dts)-1):
             if dts[i] == dts[i+1]:
                 continue
             else:
-                ps = self.position.iloc[i, 1]
-                cash = self.position.iloc[i, 0]
+                ps = position.iloc[i, 1]
+                cash = position.iloc[i, 0]
                 prices, dt = self.market.get_position_price(ps, dts[i], dts[i+1])
                 if prices is not None:
                     volumes = np.matrix(list(ps.values()), dtype=float)
@@ -183,16 +563,16 @@ class Position(object):
                 cash_matrix = cash * np.ones(asset_matrix.shape)
                 total_matrix = asset_matrix+ cash_matrix
                 data = np.concatenate((cash_matrix, asset_matrix, total_matrix), axis=0).T
-                res = res.append(pd.DataFrame(data, index=dt, columns=["cash", "asset", "total"]))
-        ps = self.position.iloc[-1, 1]
-        cash = self.position.iloc[-1, 0]
-        res = res.append(market.get_last_position_value(cash, ps, dts[-1]))
-        return res
+                res.append(pd.DataFrame(data, index=pd.to_datetime(dt), columns=["cash", "asset", "total"]))
+        ps = position.iloc[-1, 1]
+        cash = position.iloc[-1, 0]
+        res.append(self.market.get_last_position_value(cash, ps, dts[-1]))
+        return pd.concat(res)
 
 
 if __name__ == "__main__":
-    db = pymysql.connect("localhost", "root", "root", "strategy1")
-    cur = db.cursor()
+    pool = ConnectionPool(size=1)
+    cur = pool.session()
     market = MarketData(cur)
     position = Position(100000000, {}, dtt.date(2014, 1, 16), market)
     order1 = Order(dtt.date(2014, 1, 20), "070205.IB", 100000, True)
@@ -0,0 +1,306 @@
+# benchmark.py用于测试回测模块关键路径的性能，默认在本地SQLite模拟数据库（offline.py）上运行，结果写入json文件，
+# 便于不同版本之间比较
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import sys
+import json
+import time
+import platform
+import subprocess
+import numpy as np
+import datetime as dtt
+import offline
+from wind import FakeWind
+from database import Wind2DB, Data, BondYTM, bond_price_array, bond_ytm_array, p2y_future, p2y_future_array
+from backtest import Order, MarketData, Position
+from pool import ConnectionPool
+from bulkload import BulkLoader
+
+# 模拟数据规模：名称->(首发债个数，交易日个数)
+SIZES = {"small": (10, 250), "medium": (40, 750), "large": (100, 1500)}
+
+
+def make_orders(cur, dt1, dt2, hold_days=5, volume=1000):
+    """根据tb_sec中dt1至dt2之间的估值数据生成滚动买卖指令：每只首发债在每段连续有估值的区间起点买入，
+    持有hold_days个交易日（不超过区间终点）后卖出，返回按时间排序的指令单列表"""
+    sql = r"select distinct code0, dt from tb_sec where dt >= %s and dt < %s order by code0, dt"
+    data = Data(sql, cur, (dt1, dt2)).data
+    dts = sorted(set(d[1] for d in data))
+    seq = {dt: i for i, dt in enumerate(dts)}
+    runs = {}
+    for code, dt in data:
+        run = runs.setdefault(code, [[]])
+        if run[-1] and seq[dt] != seq[run[-1][-1]] + 1:
+            run.append([])
+        run[-1].append(dt)
+    orders = []
+    for code, run in runs.items():
+        for r in run:
+            if len(r) < 2:
+                continue
+            orders.append(Order(r[0], code, volume, True))
+            orders.append(Order(r[min(hold_days, len(r) - 1)], code, volume, False))
+    # 同一日先卖后买，保证持仓与现金充足
+    orders.sort(key=lambda o: (o.time, o.is_buy))
+    return orders
+
+
+def rolling_orders(symbols, dts, hold_days=5, step=3, volume=1000):
+    """对每个品种每隔step个交易日买入一次，持有hold_days个交易日后卖出，返回按时间排序的指令单列表"""
+    orders = []
+    for symbol in symbols:
+        for i in range(0, len(dts) - hold_days, step):
+            orders.append(Order(dts[i], symbol, volume, True))
+            orders.append(Order(dts[i + hold_days], symbol, volume, False))
+    orders.sort(key=lambda o: (o.time, o.is_buy))
+    return orders
+
+
+def timeit(func, *args, repeat=1):
+    """返回func多次运行中的最短耗时（秒）与最后一次运行的结果"""
+    best = np.inf
+    res = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        res = func(*args)
+        best = min(best, time.perf_counter() - t)
+    return best, res
+
+
+def bench_get_value(cur, dt1, dt2, mode="sql", hold_days=5, repeat=3):
+    """在dt1至dt2之间回放滚动指令后，分别用逐段计算（get_value_loop）与向量化计算（get_value）求账户价值，
+    返回两者的耗时、加速比以及结果的最大偏差"""
+    market = MarketData(cur, mode)
+    orders = make_orders(cur, dt1, dt2, hold_days)
+    position = Position(1e10, {}, orders[0].time, market)
+    for order in orders:
+        position.get_order(order)
+    t_loop, res_loop = timeit(position.get_value_loop, repeat=repeat)
+    t_vec, res_vec = timeit(position.get_value, repeat=repeat)
+    diff = np.nanmax(np.abs(res_loop.values - res_vec.loc[res_loop.index].values))
+    return {"orders": len(orders), "days": len(res_vec), "loop": t_loop, "vectorized": t_vec,
+            "speedup": t_loop / t_vec, "max_diff": diff}
+
+
+def replay(market, orders, batch=False):
+    """用orders回放一个账户，batch为True时使用get_orders批量成交"""
+    position = Position(1e12, {}, orders[0].time, market)
+    if batch:
+        position.get_orders(orders)
+    else:
+        for order in orders:
+            position.get_order(order)
+    return position
+
+
+def bench_offline(sizes=None, repeat=3, seed=0, loop_sizes=("small",)):
+    """在各规模的模拟数据上分别测试Position.get_order、Position.get_value、MarketData.get_paymentdt与BondYTM（逐笔与数组）的耗时，
+    返回记录列表，每条记录包括规模、测试项、取价模式、调用次数、总耗时与单次耗时。逐段计算的get_value_loop耗时
+    随规模增长过快，只在loop_sizes中的规模上测试"""
+    res = []
+    for size, (n_codes, n_days) in (sizes or SIZES).items():
+        db, cur = offline.connect()
+        dts = offline.fill(db, cur, n_codes, n_days, seed=seed)
+        symbols = Data("select distinct code0 from tb_sec", cur).select_col(0)
+        orders = rolling_orders(symbols, dts)
+
+        def record(case, mode, calls, seconds):
+            res.append({"size": size, "n_codes": n_codes, "n_days": n_days, "case": case, "mode": mode,
+                        "calls": calls, "seconds": seconds, "per_call": seconds / calls})
+
+        for mode in ["sql", "panel"]:
+            t, _ = timeit(lambda: replay(MarketData(cur, mode), orders), repeat=repeat)
+            record("Position.get_order", mode, len(orders), t)
+            t, _ = timeit(lambda: replay(MarketData(cur, mode), orders, batch=True), repeat=repeat)
+            record("Position.get_orders", mode, len(orders), t)
+            position = replay(MarketData(cur, mode), orders, batch=True)
+            t, _ = timeit(position.get_value, repeat=repeat)
+            record("Position.get_value", mode, 1, t)
+            if size in loop_sizes:
+                t, _ = timeit(position.get_value_loop, repeat=1)
+                record("Position.get_value_loop", mode, 1, t)
+
+        market = MarketData(cur)
+        t, _ = timeit(market.get_calendar, repeat=1)
+        record("CouponCalendar", "build", 1, t)
+        spans = [(dts[i], dts[i + 20]) for i in range(0, len(dts) - 20, 5)]
+        t, _ = timeit(lambda: [market.get_paymentdt(symbols, *span) for span in spans], repeat=repeat)
+        record("MarketData.get_paymentdt", "calendar", len(spans), t)
+
+        sql = r"select term, rate, dt, pay_times from tb_pri"
+        bonds = [BondYTM(*d) for d in Data(sql, cur).data]
+        args = [(bond, dt) for bond in bonds for dt in dts[::10]
+                if dt < dtt.date(bond.year0 + int(bond.term), bond.month0, bond.day0)]
+        t, prices = timeit(lambda: [bond.bond_price(dt, 3.0) for bond, dt in args], repeat=repeat)
+        record("BondYTM.bond_price", "scalar", len(args), t)
+        t, _ = timeit(lambda: [bond.bond_ytm(dt, p) for (bond, dt), p in zip(args, prices)], repeat=repeat)
+        record("BondYTM.bond_ytm", "scalar", len(args), t)
+        cols = [np.array([getattr(bond, k) for bond, _ in args]) for k in ["term", "rate", "dt0", "freq"]]
+        cols[1] = cols[1] * 100
+        dt = np.array([dt for _, dt in args], dtype="datetime64[D]")
+        t, _ = timeit(lambda: bond_price_array(*cols, dt, 3.0), repeat=repeat)
+        record("BondYTM.bond_price", "array", len(args), t)
+        t, _ = timeit(lambda: bond_ytm_array(*cols, dt, prices), repeat=repeat)
+        record("BondYTM.bond_ytm", "array", len(args), t)
+        db.close()
+    return res
+
+
+def bench_p2y(n_days=1400, repeat=3, sample=2000, seed=0):
+    """国债期货5分钟收盘价转换为收益率的吞吐量测试：n_days个交易日的TF与T分钟行情（默认约为2013年9月以来的
+    全部future_minute历史），比较逐个价格调用p2y_future与p2y_future_array整体计算，逐个调用只测试前sample个价格"""
+    db, cur = offline.connect()
+    offline.fill(db, cur, n_codes=1, n_days=n_days, n_bars=n_days, seed=seed)
+    res = []
+    for term in [5, 10]:
+        close = np.array(Data("select close from future_minute where term = %s", cur, term).select_col(0))
+        t, _ = timeit(lambda: [p2y_future(p, term) for p in close[:sample]], repeat=1)
+        res.append({"term": term, "case": "p2y_future", "mode": "scalar", "calls": min(sample, len(close)),
+                    "seconds": t, "per_call": t / min(sample, len(close))})
+        t, _ = timeit(p2y_future_array, close, term, repeat=repeat)
+        res.append({"term": term, "case": "p2y_future_array", "mode": "array", "calls": len(close), "seconds": t,
+                    "per_call": t / len(close)})
+    db.close()
+    return res
+
+
+def random_bonds(n, seed=0):
+    """n条随机的(期限，票面利率，发行日期，年付息次数，结算日)记录，结算日在发行日与到期日之间"""
+    rng = np.random.default_rng(seed)
+    term = rng.choice([1, 3, 5, 7, 10, 30], size=n).astype(float)
+    rate = np.round(rng.uniform(2, 5, n), 2)
+    dt0 = np.datetime64("2005-01-01") + rng.integers(0, 14 * 365, n).astype("timedelta64[D]")
+    freq = np.where(term >= 10, rng.choice([1, 2], size=n), 1)
+    dt = dt0 + (rng.uniform(0, 0.99, n) * 365 * term).astype(int).astype("timedelta64[D]")
+    return term, rate, dt0, freq, dt
+
+
+def bench_ytm(n=100000, repeat=3, sample=2000, seed=0):
+    """到期收益率的吞吐量测试：n条随机记录，比较逐条调用BondYTM.bond_ytm（只测试前sample条，按单条耗时折算）与
+    bond_ytm_array整体计算，speedup为单条耗时之比"""
+    term, rate, dt0, freq, dt = random_bonds(n, seed)
+    price = bond_price_array(term, rate, dt0, freq, dt, np.random.default_rng(seed).uniform(1.5, 5, n))
+    args = [(BondYTM(*x), d) for x, d in zip(zip(term[:sample], rate[:sample], dt0[:sample].astype(object),
+                                                  freq[:sample].tolist()), dt[:sample].astype(object))]
+    t1, _ = timeit(lambda: [bond.bond_ytm(d, p) for (bond, d), p in zip(args, price)], repeat=1)
+    t2, _ = timeit(bond_ytm_array, term, rate, dt0, freq, dt, price, repeat=repeat)
+    res = [{"case": "BondYTM.bond_ytm", "mode": "scalar", "calls": len(args), "seconds": t1, "per_call": t1 / len(args)},
+           {"case": "bond_ytm_array", "mode": "array", "calls": n, "seconds": t2, "per_call": t2 / n}]
+    res[1]["speedup"] = res[0]["per_call"] / res[1]["per_call"]
+    return res
+
+
+def reissues(db, cur, dts, per_code=3, seed=0):
+    """为模拟数据库中的每只首发债补充per_code只续发债（tb_pri），续发日期在交易日中随机选取，不同债券可能同日续发"""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for code0, term, rate in Data("select code, term, rate from tb_pri", cur).data:
+        for k, dt in enumerate(rng.choice(dts[20:-20], size=per_code, replace=False)):
+            rows.append(((dt, "{}{}{}.IB".format(code0[:6], "XZH"[k % 3], k), term, rate, 100, None, None, None, None,
+                          "国债", None, None, 1),))
+    cur.executemany("insert into tb_pri values %s", rows)
+    db.commit()
+
+
+def bench_wind(n_codes=40, per_code=3, latency=0.02, workers=8, batch=50, seed=0):
+    """get_data_tb_sec的吞吐量测试：FakeWind每次请求等待latency秒，比较逐只续发债串行请求（原先的做法）与
+    按区间合并、并发请求并分批写入tb_sec的耗时"""
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes, 250, seed=seed)
+    reissues(db, cur, dts, per_code, seed)
+    res = []
+    client = FakeWind(latency)
+    w2db = Wind2DB(db, cur, client, workers=1, batch=1)
+    plan = w2db.plan_tb_sec()
+
+    def serial():
+        rows = 0
+        for (dt1, dt2), items in plan.items():
+            for code_init, code, term in items:
+                rows += len(client.wsd(code_init, ",".join(w2db.tb_sec_fields), dt1, dt2).Times)
+        return rows
+
+    t, rows = timeit(serial)
+    res.append({"case": "serial", "workers": 1, "requests": client.calls, "rows": rows, "seconds": t,
+                "rows_per_second": rows / t})
+    cur.execute("delete from tb_sec")
+    client.calls = 0
+    w2db = Wind2DB(db, cur, client, workers=workers, batch=batch)
+    t, _ = timeit(w2db.insert, "tb_sec")
+    rows = Data("select count(*) from tb_sec", cur).data[0][0]
+    res.append({"case": "planned", "workers": workers, "requests": client.calls, "rows": rows, "seconds": t,
+                "rows_per_second": rows / t})
+    db.close()
+    return res
+
+
+def bench_bulk(n_days=250, batch=1000, commit_every=50000, seed=0):
+    """future_minute回填的写入速度测试：比较以executemany逐行写入（原先的做法）与BulkLoader多行insert写入，
+    以及以多行upsert重写全部记录"""
+    db, cur = offline.connect()
+    offline.fill(db, cur, n_codes=1, n_days=n_days, n_bars=n_days, seed=seed)
+    rows = Data("select * from future_minute", cur).data
+    res = []
+    cur.execute("delete from future_minute")
+    t, _ = timeit(cur.executemany, "insert into future_minute values %s", [(r,) for r in rows])
+    db.commit()
+    res.append({"case": "executemany", "batch": 1, "rows": len(rows), "seconds": t, "rows_per_second": len(rows) / t})
+    loader = BulkLoader(db, cur, batch, commit_every)
+    for case, upsert in [("values", False), ("upsert", True)]:
+        if not upsert:
+            cur.execute("delete from future_minute")
+        stats = loader.load("future_minute", rows, upsert)
+        res.append({"case": case, "batch": batch, "rows": stats["rows"], "seconds": stats["seconds"],
+                    "rows_per_second": stats["rows_per_second"]})
+    db.close()
+    return res
+
+
+def version():
+    """返回当前代码版本（git提交号），无法获取时返回None"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(path="bench_results.json", sizes=None):
+    """运行离线性能测试并将结果与运行环境一并写入json文件"""
+    res = {"version": version(), "time": dtt.datetime.now().isoformat(timespec="seconds"),
+           "python": sys.version.split()[0], "numpy": np.__version__, "machine": platform.machine(),
+           "results": bench_offline(sizes), "p2y_future": bench_p2y(), "ytm": bench_ytm(),
+           "wind": bench_wind(), "bulk": bench_bulk()}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(res, f, ensure_ascii=False, indent=1)
+    for r in res["results"]:
+        print("{size:8}{case:28}{mode:10}{calls:8d}{per_call:12.6f}".format(**r))
+    for r in res["p2y_future"]:
+        print("{term:<8}{case:28}{mode:10}{calls:8d}{per_call:12.9f}".format(**r))
+    for r in res["ytm"]:
+        print("{case:28}{mode:10}{calls:8d}{per_call:12.9f}".format(**r))
+    print("bond_ytm_array speedup: {:.0f}x".format(res["ytm"][1]["speedup"]))
+    for r in res["wind"]:
+        print("{case:8}{workers:4d}{requests:8d}{rows:8d}{seconds:10.3f}{rows_per_second:12.1f}".format(**r))
+    for r in res["bulk"]:
+        print("{case:12}{batch:6d}{rows:8d}{seconds:10.3f}{rows_per_second:12.1f}".format(**r))
+
+
+def live():
+    """在MySQL数据库上比较get_value与get_value_loop"""
+    pool = ConnectionPool(size=1)
+    cur = pool.session()
+    try:
+        for years in [1, 3, 5]:
+            dt1 = dtt.date(2014, 1, 1)
+            dt2 = dtt.date(2014 + years, 1, 1)
+            for mode in ["sql", "panel"]:
+                res = bench_get_value(cur, dt1, dt2, mode)
+                print(years, mode, res)
+    finally:
+        cur.close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+# bulkload.py为批量写入数据库的工具：以多行VALUES语句或LOAD DATA LOCAL INFILE分批写入，按批提交事务并统计写入速度，
+# 用于future_minute与tb_sec等大表的回填
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import math
+import time
+import tempfile
+import datetime as dtt
+
+
+def upsert_clause(cols):
+    """on duplicate key update之后的部分：以新值更新cols中的全部字段"""
+    return ", ".join("`{0}` = values(`{0}`)".format(c) for c in cols)
+
+
+def unwrap(row):
+    """各写入程序的记录形如([字段值, ...],)，以便作为"values %s"的单个参数，这里统一为字段值序列"""
+    if len(row) == 1 and isinstance(row[0], (list, tuple)):
+        return row[0]
+    return row
+
+
+def tsv_field(v):
+    """将字段值转换为LOAD DATA默认格式的文本：NULL与nan为\\N，日期为ISO格式，字符串中的反斜杠、制表符与换行转义"""
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return r"\N"
+    if isinstance(v, dtt.datetime):
+        return v.isoformat(" ")
+    if isinstance(v, dtt.date):
+        return v.isoformat()
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class BulkLoader(object):
+    """批量写入数据库。batch为每条多行insert语句包含的行数，commit_every为每次提交事务的行数；infile为True时改用
+    LOAD DATA LOCAL INFILE从临时TSV文件导入，连接需以local_infile=True建立（例如ConnectionPool(local_infile=True)）。
+    每次load的行数、耗时与每秒写入行数记录在stats中，verbose为True时同时打印"""
+    def __init__(self, db, cur, batch=1000, commit_every=50000, infile=False, verbose=False):
+        self.db = db
+        self.cur = cur
+        self.batch = batch
+        self.commit_every = commit_every
+        self.infile = infile
+        self.verbose = verbose
+        self.stats = []
+        self.columns = {}  # 表名->字段名列表
+
+    def get_columns(self, table):
+        """由查询结果的描述读取table的字段名（按表中顺序），每张表只查询一次，表不存在时报错"""
+        if table not in self.columns:
+            try:
+                self.cur.execute("select * from {} limit 0".format(table))
+            except Exception:
+                raise ValueError("数据库中没有表{}".format(table))
+            self.cur.fetchall()
+            self.columns[table] = [d[0].lower() for d in self.cur.description]
+        return self.columns[table]
+
+    def statement(self, table, n, upsert=False):
+        """n行的多行insert语句，upsert为True时主键已存在的记录以新值更新"""
+        cols = self.get_columns(table)
+        row = "(" + ", ".join(["%s"] * len(cols)) + ")"
+        sql = "insert into {} values {}".format(table, ", ".join([row] * n))
+        if upsert:
+            sql += " on duplicate key update " + upsert_clause(cols)
+        return sql
+
+    def insert_values(self, table, rows, upsert=False):
+        """以多行insert语句写入rows（已展开的记录列表），返回执行的语句数与跳过的行数。upsert为False时主键重复的记录
+        使insert语句报错，不会被跳过"""
+        full = self.statement(table, self.batch, upsert)
+        n = 0
+        for k in range(0, len(rows), self.batch):
+            chunk = rows[k:k + self.batch]
+            sql = full if len(chunk) == self.batch else self.statement(table, len(chunk), upsert)
+            # nan不能写入MySQL，与NULL同样处理
+            self.cur.execute(sql, [None if v != v else v for row in chunk for v in row])
+            n += 1
+        return n, 0
+
+    def insert_infile(self, table, rows, upsert=False):
+        """将rows写入临时TSV文件后以LOAD DATA LOCAL INFILE导入，返回执行的语句数与跳过的行数。upsert为True时以replace
+        替换主键重复的记录；否则以ignore跳过主键重复的记录（LOAD DATA LOCAL不报错而是跳过重复记录），跳过的行数为
+        rows的行数与实际写入行数之差"""
+        fd, path = tempfile.mkstemp(suffix=".tsv")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="\n") as f:
+                for row in rows:
+                    f.write("\t".join(map(tsv_field, row)) + "\n")
+            sql = r"load data local infile %s {} into table {} character set utf8mb4".format(
+                "replace" if upsert else "ignore", table)
+            affected = self.cur.execute(sql, path.replace("\\", "/"))
+        finally:
+            os.remove(path)
+        # replace时affected包含被替换记录的删除与插入，无法得出跳过的行数，此时不会跳过记录
+        return 1, 0 if upsert else len(rows) - affected
+
+    def load(self, table, rows, upsert=False):
+        """将rows写入table，每commit_every行提交一次，rows可以是生成器，返回本次写入的统计，skipped为因主键重复而
+        跳过的行数（只在infile为True且upsert为False时可能不为0），不为0时打印提示"""
+        self.get_columns(table)
+        write = self.insert_infile if self.infile else self.insert_values
+        rows = iter(rows)
+        n = statements = skipped = 0
+        t0 = time.perf_counter()
+        while True:
+            chunk = []
+            for row in rows:
+                chunk.append(unwrap(row))
+                if len(chunk) == self.commit_every:
+                    break
+            if not chunk:
+                break
+            k, s = write(table, chunk, upsert)
+            statements += k
+            skipped += s
+            self.db.commit()
+            n += len(chunk)
+        seconds = time.perf_counter() - t0
+        res = {"table": table, "rows": n, "statements": statements, "skipped": skipped, "seconds": seconds,
+               "rows_per_second": n / seconds if seconds else float("inf")}
+        self.stats.append(res)
+        if skipped:
+            print("{}: {}行因主键重复被跳过".format(table, skipped))
+        if self.verbose:
+            print("{table}: {rows}行，{statements}条语句，{seconds:.2f}秒，{rows_per_second:.0f}行/秒".format(**res))
+        return res
@@ -0,0 +1,151 @@
+# cache.py为Data查询结果的磁盘缓存：以数据库标识、规范化的SQL、参数与所涉及表的数据版本作为键，将结果保存为npz文件，
+# 数据写入程序更新表的版本后，旧的缓存自动失效
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import re
+import json
+import time
+import hashlib
+import numpy as np
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_cache")
+# 缓存目录，可由环境变量STRATEGY1_CACHE_DIR或set_dir指定，离线测试与性能测试使用临时目录
+CACHE_DIR = os.environ.get("STRATEGY1_CACHE_DIR", DEFAULT_DIR)
+VERSIONS = "versions.json"
+
+
+def set_dir(path):
+    """设置缓存目录，之后的bump与未指定目录的QueryCache均使用该目录"""
+    global CACHE_DIR
+    CACHE_DIR = path
+
+
+def normalize(sql):
+    """去掉SQL语句中多余的空白，使仅排版不同的语句对应同一个键"""
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def tables(sql):
+    """SQL语句from与join子句中出现的表名"""
+    return sorted(set(t.lower() for t in re.findall(r"\b(?:from|join)\s+(\w+)", sql, re.I)))
+
+
+def read_versions(path=None):
+    path = path or CACHE_DIR
+    try:
+        with open(os.path.join(path, VERSIONS), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def bump(*names, path=None):
+    """更新表的数据版本，写入数据库的方法在提交后调用，使涉及这些表的缓存失效"""
+    path = path or CACHE_DIR
+    os.makedirs(path, exist_ok=True)
+    versions = read_versions(path)
+    stamp = time.time_ns()
+    for name in names:
+        versions[name.lower()] = stamp
+    tmp = os.path.join(path, VERSIONS + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(versions, f)
+    os.replace(tmp, os.path.join(path, VERSIONS))
+
+
+class QueryCache(object):
+    """查询结果的磁盘缓存，只缓存select语句。每条结果保存为一个npz文件，文件总大小超过max_bytes时按最近使用时间
+    淘汰最久未使用的文件。键中包含数据库标识（namespace，Data传入pool.database_id），不同数据库的结果互不混用。
+    stats记录命中、未命中与淘汰次数。使用方法：Data.cache = QueryCache()"""
+    def __init__(self, path=None, max_bytes=512 * 2 ** 20):
+        self.path = path or CACHE_DIR
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.versions = {}
+        self.versions_mtime = None
+        self.total = None  # 缓存文件总大小的估计，首次写入时统计，超过max_bytes时才扫描目录淘汰
+        os.makedirs(self.path, exist_ok=True)
+
+    def table_versions(self, names):
+        """读取表的数据版本，versions.json未变化时使用内存中的副本"""
+        try:
+            mtime = os.stat(os.path.join(self.path, VERSIONS)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.versions_mtime:
+            self.versions = read_versions(self.path)
+            self.versions_mtime = mtime
+        return [self.versions.get(name, 0) for name in names]
+
+    def key(self, sql, args, namespace=None):
+        names = tables(sql)
+        text = repr((namespace, normalize(sql), args, names, self.table_versions(names)))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    @staticmethod
+    def cacheable(sql):
+        return sql.lstrip().lower().startswith(("select", "with"))
+
+    def get(self, sql, args=None, namespace=None):
+        """返回缓存的(结果，字段名)，没有缓存时返回None，namespace为数据库标识"""
+        if not self.cacheable(sql):
+            return None
+        path = os.path.join(self.path, self.key(sql, args, namespace) + ".npz")
+        try:
+            with np.load(path, allow_pickle=True) as f:
+                data, names = tuple(map(tuple, f["data"])), [str(n) for n in f["names"]]
+        except (FileNotFoundError, OSError, ValueError):
+            self.stats["misses"] += 1
+            return None
+        os.utime(path)  # 以修改时间记录最近一次使用
+        self.stats["hits"] += 1
+        return data, names
+
+    def put(self, sql, args, data, names, namespace=None):
+        if not self.cacheable(sql):
+            return
+        path = os.path.join(self.path, self.key(sql, args, namespace) + ".npz")
+        rows = np.empty((len(data), len(names)), dtype=object)
+        if len(data):
+            rows[:] = data
+        tmp = path[:-4] + ".tmp.npz"
+        np.savez(tmp, data=rows, names=np.array(names, dtype=str))
+        if self.total is None:
+            self.total = self.size()
+        if os.path.exists(path):
+            self.total -= os.path.getsize(path)
+        self.total += os.path.getsize(tmp)
+        os.replace(tmp, path)
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """缓存文件的(最近使用时间，大小，路径)列表"""
+        res = []
+        for name in os.listdir(self.path):
+            if name.endswith(".npz") and not name.endswith(".tmp.npz"):
+                st = os.stat(os.path.join(self.path, name))
+                res.append((st.st_mtime_ns, st.st_size, os.path.join(self.path, name)))
+        return res
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """文件总大小超过max_bytes时，从最久未使用的文件开始删除"""
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            self.stats["evictions"] += 1
+        self.total = total
+
+    def clear(self):
+        for _, _, path in self.entries():
+            os.remove(path)
+        self.total = 0
@@ -0,0 +1,103 @@
+# checkpoint.py用于回测的检查点：定期将Position的状态以二进制npz文件保存，指令单变化时从最近的未受影响的检查点继续回测
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import re
+import time
+import hashlib
+import numpy as np
+from backtest import MarketData, Position
+from cost import FixedFee
+
+
+def order_key(order):
+    """指令单的字节表示，用于计算指令单序列的摘要"""
+    return "{}|{}|{}|{}\n".format(order.time, order.symbol, order.volume, int(order.is_buy)).encode()
+
+
+def save(path, state, digest, offset):
+    """将账户状态state连同指令单前缀摘要digest与已处理的指令单个数offset写入path"""
+    np.savez(path, digest=np.array(digest), offset=np.array(offset), **state)
+
+
+def load(path):
+    """读取检查点，返回账户状态、指令单前缀摘要与已处理的指令单个数"""
+    with np.load(path) as f:
+        state = {k: f[k] for k in f.files}
+    return state, str(state.pop("digest")), int(state.pop("offset"))
+
+
+class WalkForward(object):
+    """带检查点的回测：每处理every笔指令单保存一次检查点（文件名为ckpt_已处理指令单个数.npz），每个检查点记录
+    回测设置（初始资金、初始时间与成本模型）及其之前全部指令单的摘要。再次运行时，找到摘要与新的设置及指令单序列
+    相同的最后一个检查点，从该处恢复账户并只重算之后的指令单，设置改变后原有检查点均不再使用"""
+    def __init__(self, path, market: MarketData, cash, time0, every=1000, cost=None):
+        self.path = path
+        self.market = market
+        self.cash = cash
+        self.time0 = time0
+        self.every = every
+        self.cost = cost
+        self.stats = {}
+        os.makedirs(path, exist_ok=True)
+
+    def checkpoints(self):
+        """返回已有检查点的(已处理指令单个数，文件路径)列表，按个数从大到小排序"""
+        res = []
+        for name in os.listdir(self.path):
+            m = re.match(r"ckpt_(\d+)\.npz$", name)
+            if m:
+                res.append((int(m.group(1)), os.path.join(self.path, name)))
+        return sorted(res, reverse=True)
+
+    def config_key(self):
+        """回测设置的字节表示，作为摘要的起点"""
+        cost = self.cost or FixedFee()
+        return "{}|{}\n".format(repr((self.cash, self.time0)), cost.key()).encode()
+
+    def prefix_digests(self, orders):
+        """计算orders每个检查点位置（every的整数倍）之前的摘要，摘要以回测设置开始，再依次加入各指令单"""
+        h = hashlib.sha1(self.config_key())
+        res = {0: h.hexdigest()}
+        for i, order in enumerate(orders):
+            h.update(order_key(order))
+            if (i + 1) % self.every == 0:
+                res[i + 1] = h.hexdigest()
+        return res
+
+    def resume(self, digests):
+        """找到与当前指令单前缀一致的最近检查点并恢复账户，没有可用检查点时从初始资金开始"""
+        for offset, path in self.checkpoints():
+            if offset not in digests:
+                continue
+            t = time.perf_counter()
+            state, digest, _ = load(path)
+            if digest == digests[offset]:
+                position = Position.restore(state, self.market, self.cost)
+                self.stats["restore_seconds"] = time.perf_counter() - t
+                return position, offset
+        return Position(self.cash, {}, self.time0, self.market, self.cost), 0
+
+    def run(self, orders):
+        """回测按时间排序的指令单序列，返回最终的账户，self.stats中记录恢复位置、检查点的保存与恢复耗时以及文件大小"""
+        self.stats = {"restore_seconds": 0.0}
+        digests = self.prefix_digests(orders)
+        position, offset = self.resume(digests)
+        self.stats.update({"resumed_from": offset, "recomputed": len(orders) - offset, "snapshots": 0,
+                           "snapshot_seconds": 0.0, "bytes": 0})
+        # 删除与当前指令单不一致的过期检查点
+        for k, path in self.checkpoints():
+            if k > offset:
+                os.remove(path)
+        for a in range(offset, len(orders), self.every):
+            b = min(a + self.every, len(orders))
+            position.get_orders(orders[a:b])
+            if b % self.every == 0:
+                t = time.perf_counter()
+                path = os.path.join(self.path, "ckpt_{}.npz".format(b))
+                save(path, position.snapshot(), digests[b], b)
+                self.stats["snapshot_seconds"] += time.perf_counter() - t
+                self.stats["snapshots"] += 1
+                self.stats["bytes"] = os.path.getsize(path)
+        return position
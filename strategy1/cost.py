@@ -0,0 +1,94 @@
+# cost.py为回测的交易成本与滑点模型，所有模型均对指令单数组整体计算，不在单笔指令单上做Python循环
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import numpy as np
+
+
+def by_term(mapping: dict, terms, default=0.0):
+    """按期限查表，mapping的键为期限，值为对应参数，对terms中的不同期限只查一次"""
+    keys, inverse = np.unique(np.asarray(terms, dtype=float), return_inverse=True)
+    values = np.array([mapping.get(k, default) for k in keys], dtype=float)
+    return values[inverse]
+
+
+class CostModel(object):
+    """交易成本模型基类。模型以价格、数量、买卖方向与期限数组为输入，返回成交价数组与费用数组，
+    needs_term为True时Position会先从MarketData查询品种期限"""
+    needs_term = False
+
+    def __call__(self, price, volume, is_buy, term=None):
+        return np.asarray(price, dtype=float), np.zeros(len(volume))
+
+    def __add__(self, other):
+        return CostChain(self, other)
+
+    def key(self):
+        """模型的标识（类名与全部参数），参数相同的模型标识相同，用于判断检查点是否由相同的成本模型生成"""
+        return "{}{}".format(type(self).__name__, sorted(vars(self).items()))
+
+
+class CostChain(CostModel):
+    """依次叠加多个成本模型，前一个模型的成交价作为后一个模型的输入价格，费用相加"""
+    def __init__(self, *models):
+        self.models = []
+        for model in models:
+            self.models.extend(model.models if isinstance(model, CostChain) else [model])
+        self.needs_term = any(m.needs_term for m in self.models)
+
+    def key(self):
+        return "CostChain({})".format(", ".join(m.key() for m in self.models))
+
+    def __call__(self, price, volume, is_buy, term=None):
+        fee = np.zeros(len(volume))
+        for model in self.models:
+            price, f = model(price, volume, is_buy, term)
+            fee += f
+        return price, fee
+
+
+class FixedFee(CostModel):
+    """按成交数量收取固定费率，rate为每张费用，默认为每张0.003元（原backtest.fee的费率）"""
+    def __init__(self, rate=0.003):
+        self.rate = rate
+
+    def __call__(self, price, volume, is_buy, term=None):
+        return np.asarray(price, dtype=float), self.rate * np.asarray(volume, dtype=float)
+
+
+class SpreadByTerm(CostModel):
+    """按期限的买卖价差，spreads的键为期限，值为买卖价差（元），买入以估值加半个价差成交，卖出以估值减半个价差成交"""
+    needs_term = True
+
+    def __init__(self, spreads: dict, default=0.0):
+        self.spreads = spreads
+        self.default = default
+
+    def __call__(self, price, volume, is_buy, term=None):
+        half = by_term(self.spreads, term, self.default) / 2
+        return np.asarray(price, dtype=float) + np.where(is_buy, half, -half), np.zeros(len(volume))
+
+
+class MarketImpact(CostModel):
+    """成交量的市场冲击，冲击成本（元/张）= coef * (volume / unit) ** exponent，买入推高、卖出压低成交价"""
+    def __init__(self, coef=0.01, exponent=0.5, unit=1e5):
+        self.coef = coef
+        self.exponent = exponent
+        self.unit = unit
+
+    def __call__(self, price, volume, is_buy, term=None):
+        impact = self.coef * (np.asarray(volume, dtype=float) / self.unit) ** self.exponent
+        return np.asarray(price, dtype=float) + np.where(is_buy, impact, -impact), np.zeros(len(volume))
+
+
+class AuctionRebate(CostModel):
+    """一级市场招标的返费，买入时成交价扣除按期限确定的返费，默认返费与DB2self.insert_impact一致：
+    3年期国债5分钱，5、7、10、30年期国债0.1元"""
+    needs_term = True
+
+    def __init__(self, rebates=None):
+        self.rebates = rebates or {3: 0.05, 5: 0.1, 7: 0.1, 10: 0.1, 30: 0.1}
+
+    def __call__(self, price, volume, is_buy, term=None):
+        rebate = by_term(self.rebates, term)
+        return np.asarray(price, dtype=float) - np.where(is_buy, rebate, 0), np.zeros(len(volume))
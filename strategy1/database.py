@@ -3,14 +3,33 @@
 # 创建日期：2018/10/22
 # 更新时间：2019/2/14
 import pymysql
-import win32com.client
-from WindPy import w
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None  # 未安装openpyxl时无法读取Excel表格，ReadExcel与Excel2DB不可用
+try:
+    from WindPy import w
+except ImportError:
+    w = None  # 未安装Wind终端时无法从Wind提取数据，其余功能（如离线测试）不受影响
 import datetime as dtt
 import numpy as np
 import pandas as pd
 import scipy.optimize as optimize
 import re
 import math
+import functools
+import bisect
+import array
+import os
+import concurrent.futures
+from pool import ConnectionPool, database_id
+from cache import bump
+import tradedays
+import collections
+from wind import WindClient, fetch, fetch_all
+from bulkload import BulkLoader, upsert_clause
+
+EPOCH = dtt.date(1970, 1, 1).toordinal()  # datetime64[D]的零点对应的序数日
 
 
 def create_database(cur, table=None):
@@ -157,9 +176,19 @@ def create_database(cur, table=None):
     `bondtype` CHAR(10) DEFAULT NULL COMMENT '债券类型'
     )ENGINE=InnoDB DEFAULT CHARSET=UTF8MB3 COMMENT = '发行冲击'
     """
+    sql_watermark = """
+    CREATE TABLE IF NOT EXISTS watermark(
+    `tb` CHAR(15) NOT NULL COMMENT '表名',
+    `series` CHAR(15) NOT NULL COMMENT '序列，例如债券类型、代码、期限或表名',
+    `dt` DATETIME DEFAULT NULL COMMENT '已同步数据的最新日期',
+    `nrows` INT DEFAULT NULL COMMENT '最近一次同步写入的行数',
+    `updated` DATETIME NOT NULL COMMENT '最近一次同步的时间',
+    CONSTRAINT pk PRIMARY KEY(`tb`, `series`)
+    )ENGINE=InnoDB DEFAULT CHARSET=UTF8MB3 COMMENT = '增量同步的水位'
+    """
     if table is None:
         for sql in [sql_tb_pri, sql_appendix1, sql_tb_sec, sql_tb_rate, sql_future, sql_tb_sec_delta, sql_future_delta,
-                    sql_payment, sql_money, sql_future_minute, sql_dts1, sql_dts2, sql_impact]:
+                    sql_payment, sql_money, sql_future_minute, sql_dts1, sql_dts2, sql_impact, sql_watermark]:
             _ = cur.execute(sql)
     elif table == "pass":
         pass
@@ -167,42 +196,138 @@ def create_database(cur, table=None):
         _ = cur.execute(eval("sql_{}".format(table)))
 
 
+class SqlRecorder(object):
+    """只记录而不执行SQL语句的游标，用于获取create_database中各表的建表语句"""
+    def __init__(self):
+        self.sqls = []
+
+    def execute(self, sql, args=None):
+        self.sqls.append(sql)
+
+
+def create_sql(table=None):
+    """返回create_database中各表的建表语句列表，table的含义与create_database相同"""
+    recorder = SqlRecorder()
+    create_database(recorder, table)
+    return [sql for sql in recorder.sqls if not sql.lstrip().lower().startswith("create database")]
+
+
+# 建表语句中字段类型（按顺序匹配）对应的NumPy类型，char类型对应pandas的category
+SQL_DTYPES = [(r"datetime", "datetime64[s]"), (r"date", "datetime64[D]"), (r"double|decimal", "float64"),
+              (r"float", "float32"), (r"tinyint", "int8"), (r"smallint", "int16"), (r"bigint", "int64"),
+              (r"int", "int32"), (r"char|text", "category")]
+
+
+@functools.lru_cache(maxsize=None)
+def schema():
+    """由create_database的建表语句解析各表字段的类型，返回{表名: {字段名: dtype}}，可为空的整数字段为float64，
+    以便用nan表示NULL"""
+    res = {}
+    for sql in create_sql():
+        table = re.search(r"exists\s+(\w+)", sql, re.I).group(1).lower()
+        res[table] = {}
+        for name, sql_type, rest in re.findall(r"^\s*`(\w+)`\s+(\w+)(.*)$", sql, re.M):
+            dtype = next((d for pattern, d in SQL_DTYPES if re.match(pattern, sql_type, re.I)), None)
+            if dtype and dtype.startswith("int") and not re.search(r"not null|primary key", rest, re.I):
+                dtype = "float64"
+            res[table][name.lower()] = dtype
+    return res
+
+
+def upsert_sql(table):
+    """table的upsert语句：以executemany逐行写入，主键已存在时以新值更新全部字段"""
+    return r"insert into {} values %s on duplicate key update {}".format(table, upsert_clause(schema()[table]))
+
+
+def as_datetime(dt):
+    """将数据库返回的日期（date、datetime或日期字符串）统一为datetime"""
+    return np.datetime64(dt, "s").astype(object)
+
+
+def set_watermark(cur, table, series, dt, rows):
+    """在watermark表中记录table的序列series已同步至dt，本次写入rows行"""
+    sql = upsert_sql("watermark")
+    cur.execute(sql, ((table, str(series), dt, rows, dtt.datetime.now().replace(microsecond=0)),))
+
+
 def dt_offset(cur, dt0, offset:int, table="dts2"):
-    """从数据库中提取交易日的偏离值，默认使用银行间交易日（dts2)"""
-    sql = """
-             select t1.dt from {0} t1 inner join {0} t2 on t2.dt = %s and t1.seq = t2.seq + %s
-             """.format(table)
-    dt = Data(sql, cur, (dt0, offset)).data[0][0]
-    return dt
+    """交易日的偏离值，默认使用银行间交易日（dts2)，由进程内缓存的交易日历计算，不再逐次查询数据库"""
+    return tradedays.calendar(cur, table).offset(dt0, offset)
+
+
+FUTURE_FLOWS = {2: [3, 103], 5: [3, 3, 3, 3, 103], 10: [3, 3, 3, 3, 3, 3, 3, 3, 3, 103]}  # 国债期货名义标准券的现金流
+
+
+def p2y_future_array(price, term, guess=0.03, tol=1e-12, maxiter=50, bounds=(-0.5, 1.0)):
+    """由国债期货价格批量计算名义标准券（票面利率3%）的到期收益率（小数），price为任意形状的价格数组。对不重复的
+    价格同时进行牛顿迭代，收益率限定在bounds之间：非正、非有限或对应收益率超出bounds的价格视为无效，不参与迭代。
+    返回到期收益率与是否收敛的布尔数组，无效或未收敛的记录收益率为nan"""
+    if term not in FUTURE_FLOWS:
+        raise ValueError("不被接受的参数值term")
+    flows = np.array(FUTURE_FLOWS[term], dtype=float)
+    i = np.arange(1, len(flows) + 1)
+    price = np.asarray(price, dtype=float)
+    keys, inverse = np.unique(price, return_inverse=True)
+    low, high = [(flows * (1 + b) ** -i).sum() for b in bounds[::-1]]
+    y = np.full(keys.shape, guess)
+    converged = np.zeros(keys.shape, dtype=bool)
+    active = np.flatnonzero(np.isfinite(keys) & (keys > max(low, 0)) & (keys < high))
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        for _ in range(maxiter):
+            if not len(active):
+                break
+            v = (1 + y[active, None]) ** -i
+            f = (flows * v).sum(axis=1) - keys[active]
+            fprime = -(i * flows * v / (1 + y[active, None])).sum(axis=1)
+            step = f / fprime
+            y[active] -= step
+            done = np.abs(step) <= tol
+            converged[active[done]] = True
+            active = active[~done & np.isfinite(step)]
+    y = np.where(converged, y, np.nan)
+    return y[inverse].reshape(price.shape), converged[inverse].reshape(price.shape)
 
 
 def p2y_future(price, term):
-    if term == 5:
-        flow = [3, 3, 3, 3, 103]
-    elif term == 10:
-        flow = [3, 3, 3, 3, 3, 3, 3, 3, 3, 103]
-    elif term == 2:
-        flow = [3, 103]
-    else:
-        flow = None
+    """由国债期货价格计算名义标准券的到期收益率（%），price为列表时返回列表，无效或未收敛的价格为None（标量时为
+    nan）。原先逐个价格调用np.irr，现由p2y_future_array一次计算"""
+    y, _ = p2y_future_array(price, term)
+    y = 100 * np.round(y, 6)
     if isinstance(price, list):
-        res = [100 * round(np.irr([-p, *flow]), 6) for p in price]
-    else:
-        res = 100 * round(np.irr([-price, *flow]), 6)
-    return res
+        return [None if np.isnan(v) else v for v in y.tolist()]
+    return float(y)
 
 
-def get_freq(code):
-    """从Wind中提取债券的年付息次数"""
-    wdata = w.wss(code, "interestfrequency")
-    res = wdata.Data[0][0]
-    if res is None:
-        res = 1
-    return res
+def add_months(dt: dtt.date, months, day=None):
+    """将日期dt平移months个月，day为目标日（默认为dt的日），超过当月天数时取当月最后一天"""
+    m = dt.year * 12 + dt.month - 1 + months
+    year, month = m // 12, m % 12 + 1
+    day = dt.day if day is None else day
+    last_day = (dtt.date(year + month // 12, month % 12 + 1, 1) - dtt.timedelta(1)).day
+    return dtt.date(year, month, min(day, last_day))
+
+
+def default_client():
+    """默认的Wind接口：调用WindPy，未安装Wind终端时为None"""
+    return WindClient(w) if w is not None else None
+
+
+def get_freq(code, client=None):
+    """从Wind中提取债券的年付息次数，缺失时为1，client为Wind接口，默认为default_client()"""
+    return get_freqs([code], client)[0]
+
+
+def get_freqs(codes, client=None):
+    """get_freq的批量版本，一次请求提取全部债券的年付息次数"""
+    client = client if client is not None else default_client()
+    wdata = fetch(client, "wss", list(codes), "interestfrequency", "")
+    return [1 if f is None else f for f in wdata.Data[0]]
 
 
 class Data(object):
     """本类用于从mysql中提取相应条件的数据"""
+    cache = None  # 查询结果的磁盘缓存（cache.QueryCache），为None时不使用缓存
+
     def __init__(self, sql, cur, args=None):
         self.sql = sql
         self.cur = cur
@@ -215,13 +340,294 @@ class Data(object):
     __repr__ = __str__
 
     def get_data(self):
+        if self.cache is not None:
+            namespace = database_id(self.cur)
+            hit = self.cache.get(self.sql, self.args, namespace)
+            if hit is not None:
+                data, self.names = hit
+                return data
         _ = self.cur.execute(self.sql, self.args)
         data = self.cur.fetchall()
+        self.names = [d[0] for d in self.cur.description or []]
+        if self.cache is not None:
+            self.cache.put(self.sql, self.args, data, self.names, namespace)
         return data
 
     def select_col(self, col):
         return [d[col] for d in self.data]
 
+    def dtypes(self, tables=None):
+        """按建表语句推断查询结果各列的类型，tables为查询涉及的表，默认从sql的from与join子句中提取，
+        在这些表中找不到的列（例如聚合函数）为None"""
+        tables = tables or re.findall(r"\b(?:from|join)\s+(\w+)", self.sql, re.I)
+        columns = schema()
+        res = []
+        for name in self.names:
+            name = name.lower()
+            res.append(next((columns[t][name] for t in tables if name in columns.get(t.lower(), {})), None))
+        return res
+
+    def columns(self, dtypes=None, tables=None):
+        """以列的形式返回查询结果，每列按建表语句的类型一次性转换：日期为datetime64，float为float32，double为
+        float64，char为pandas.Categorical，NULL为nan或NaT。dtypes为{列名: dtype}，用于覆盖推断的类型"""
+        dtypes = dtypes or {}
+        cols = list(zip(*self.data)) if self.data else [()] * len(self.names)
+        res = []
+        for name, dtype, col in zip(self.names, self.dtypes(tables), cols):
+            dtype = dtypes.get(name, dtype)
+            if dtype == "category":
+                res.append(pd.Categorical(col))
+                continue
+            try:
+                arr = np.array(col, dtype=dtype)
+            except (TypeError, ValueError):
+                arr = np.array(col, dtype="float64")  # 含NULL的整数列
+            if arr.dtype == object:
+                try:
+                    arr = arr.astype("float64")  # 聚合函数返回的Decimal等
+                except (TypeError, ValueError):
+                    pass
+            res.append(arr)
+        return res
+
+    def select_array(self, col, dtype=None):
+        """以类型化数组的形式返回第col列，用于替代np.array(select_col(col))"""
+        name = self.names[col]
+        return self.columns({name: dtype} if dtype else None)[col]
+
+    def to_frame(self, dtypes=None, tables=None):
+        """以类型化的DataFrame返回查询结果，列名为查询结果的字段名"""
+        df = pd.DataFrame(dict(enumerate(self.columns(dtypes, tables))), columns=range(len(self.names)))
+        df.columns = self.names
+        return df
+
+    @staticmethod
+    def stream(sql, cur, args=None, size=10000, records=False):
+        """流式查询，逐块返回结果而不一次读入全部数据：每块最多size行，records为True时每块为以字段名命名的NumPy
+        记录数组，否则为元组列表。cur为pymysql游标时改用同一连接上的无缓冲服务器端游标（SSCursor），遍历结束或
+        生成器关闭前该连接不能执行其他查询"""
+        conn = getattr(cur, "connection", None)
+        server_side = isinstance(conn, pymysql.connections.Connection)
+        if server_side:
+            cur = conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            _ = cur.execute(sql, args)
+            names = [d[0] for d in cur.description]
+            while True:
+                chunk = cur.fetchmany(size)
+                if not chunk:
+                    break
+                yield np.rec.fromrecords(chunk, names=names) if records else list(chunk)
+        finally:
+            if server_side:
+                cur.close()
+
+
+def coupon_date(m0, day0, months):
+    """付息日的向量化推算：m0为发行月份（datetime64[M]），day0为发行日的日，months为发行后的月数，
+    超过当月天数时取当月最后一天"""
+    m = m0 + months
+    start = m.astype("datetime64[D]")
+    days = ((m + 1).astype("datetime64[D]") - start).astype(int)
+    return start + np.minimum(day0, days) - 1
+
+
+def get_ts_array(term, dt0, freq, dt):
+    """BondYTM.get_ts的向量化版本，term、dt0、freq、dt为等长数组或标量，返回距下一付息日的期数t0与剩余付息次数n，
+    get_ts返回的ts即range(n)，付息日推算规则与get_ts相同"""
+    term, freq = np.asarray(term, dtype=float), np.asarray(freq, dtype=int)
+    dt0, dt = np.asarray(dt0, dtype="datetime64[D]"), np.asarray(dt, dtype="datetime64[D]")
+    term, dt0, freq, dt = np.broadcast_arrays(term, dt0, freq, dt)
+    m0 = dt0.astype("datetime64[M]")
+    day0 = (dt0 - m0.astype("datetime64[D]")).astype(int) + 1
+    step = 12 // freq
+    # k为下一付息日的序号，先按月份估计，再根据当月付息日是否已过修正
+    k = (dt.astype("datetime64[M]") - m0).astype(int) // step
+    k = np.where(coupon_date(m0, day0, step * k) < dt, k + 1, k)
+    # 发行日当天，get_ts除半年付息且发行月份在下半年的情况外，均以发行后的第一个付息日作为下一付息日
+    k = np.where((dt == dt0) & ((freq == 1) | (m0.astype(int) % 12 < 6)), 1, k)
+    nxt = coupon_date(m0, day0, step * k)
+    prev = coupon_date(m0, day0, step * (k - 1))
+    # 下半年发行的半年付息债，get_ts推算次年的付息日时沿用当年付息日的日（例如不会取到闰年的2月29日），此处保持一致
+    late = (freq == 2) & (m0.astype(int) % 12 >= 6) & (nxt.astype("datetime64[Y]") > dt.astype("datetime64[Y]"))
+    if late.any():
+        # 只对需要修正的记录推算
+        last = coupon_date(m0[late], day0[late], step[late] * k[late] - 12)
+        last_day = (last - last.astype("datetime64[M]").astype("datetime64[D]")).astype(int) + 1
+        nxt[late] = coupon_date(nxt[late].astype("datetime64[M]"), last_day, 0)
+    t0 = ((nxt - dt).astype(int) + 1) / (nxt - prev).astype(int)
+    n = (freq * term).astype(int) - (k - 1)
+    return t0, n
+
+
+class CashFlowSchedule(object):
+    """单只债券的付息计划：按BondYTM.get_ts的规则一次性推算全部付息日与每期现金流，以紧凑的array数组保存（日期为
+    1970-01-01起的天数），任意结算日的下一付息日由二分查找得到。dates[i]为发行后第i-1个付息日（dates[1]为发行日），
+    late为下半年发行的半年付息债跨年时get_ts实际使用的付息日（沿用上一年同月付息日的日），years为dates[i]所在年份的
+    1月1日，flows[i]为dates[i]当日每张债券的现金流，最后一期包含本金"""
+    __slots__ = ("term", "freq", "n", "dates", "late", "years", "flows")
+
+    def __init__(self, term, rate, dt0: dtt.date, freq=1, par=100):
+        if freq not in (1, 2):
+            raise ValueError("不被接受的参数值freq")
+        self.term = term
+        self.freq = int(freq)
+        self.n = int(self.freq * term)
+        step = 12 // self.freq
+        m0 = np.datetime64(dt0, "M")
+        k = np.arange(-1, self.n + 1)
+        dates = coupon_date(m0, dt0.day, step * k)
+        self.dates = array.array("i", dates.astype(int))
+        if self.freq == 2 and dt0.month > 6:
+            last = coupon_date(m0, dt0.day, step * k - 12)
+            last_day = (last - last.astype("datetime64[M]").astype("datetime64[D]")).astype(int) + 1
+            self.late = array.array("i", coupon_date(dates.astype("datetime64[M]"), last_day, 0).astype(int))
+            self.years = array.array("i", dates.astype("datetime64[Y]").astype("datetime64[D]").astype(int))
+        else:
+            self.late = None
+            self.years = None
+        self.flows = array.array("d", np.where(k > 0, par * rate / 100 / self.freq, 0.0))
+        self.flows[-1] += par
+
+    def __len__(self):
+        return self.n
+
+    def lookup(self, dt: dtt.date):
+        """结算日dt距下一付息日的期数t0与剩余付息次数n，与BondYTM.get_ts的结果一致，dt须在发行日与到期日之间"""
+        d = dt.toordinal() - EPOCH
+        dates = self.dates
+        if d < dates[1] or d > dates[-1]:
+            raise ValueError("结算日不在发行日与到期日之间")
+        i = bisect.bisect_left(dates, d)
+        nxt = dates[i]
+        if self.late is None:
+            # 发行日当天，除下半年发行的半年付息债外，均以发行后的第一个付息日作为下一付息日
+            if d == dates[1]:
+                i, nxt = 2, dates[2]
+        elif d < self.years[i]:
+            nxt = self.late[i]
+        return (nxt - d + 1) / (nxt - dates[i - 1]), self.n - i + 2
+
+    def lookup_array(self, dt):
+        """lookup的向量化版本，dt为日期数组"""
+        d = np.asarray(dt, dtype="datetime64[D]").astype(int)
+        dates = np.frombuffer(self.dates, dtype=np.int32)
+        if np.any(d < dates[1]) or np.any(d > dates[-1]):
+            raise ValueError("结算日不在发行日与到期日之间")
+        i = np.searchsorted(dates, d)
+        if self.late is None:
+            i = np.where(d == dates[1], 2, i)
+            nxt = dates[i]
+        else:
+            late = np.frombuffer(self.late, dtype=np.int32)
+            nxt = np.where(d < np.frombuffer(self.years, dtype=np.int32)[i], late[i], dates[i])
+        return (nxt - d + 1) / (nxt - dates[i - 1]), self.n - i + 2
+
+    def remaining(self, dt: dtt.date):
+        """结算日dt之后（含当日）的付息日与每张现金流"""
+        i = max(bisect.bisect_left(self.dates, dt.toordinal() - EPOCH), 2)
+        dates = np.frombuffer(self.dates, dtype=np.int32)[i:].astype("datetime64[D]")
+        return dates, np.frombuffer(self.flows)[i:]
+
+
+@functools.lru_cache(maxsize=4096)
+def cash_flow_schedule(term, rate, dt0: dtt.date, freq=1, par=100):
+    """付息计划的缓存，相同的债券只推算一次，最多保留maxsize只债券，超出时淘汰最久未使用的"""
+    return CashFlowSchedule(term, rate, dt0, freq, par)
+
+
+def bond_schedule(term, rate, dt0, freq, dt, par=100):
+    """bond_derivatives与bond_ytm_array共用的付息计划：各参数为等长数组或标量，返回距下一付息日的期数t0、剩余付息
+    次数n（已到期的记录为0）、每期利息、按单利贴现的记录（1年期债券）与年付息次数"""
+    term, rate, dt0, freq, dt = np.broadcast_arrays(np.asarray(term, dtype=float), np.asarray(rate, dtype=float),
+                                                    np.asarray(dt0, dtype="datetime64[D]"), np.asarray(freq),
+                                                    np.asarray(dt, dtype="datetime64[D]"))
+    t0, n = get_ts_array(term, dt0, freq, dt)
+    return t0, np.maximum(n, 0), par * rate / 100 / freq, term == 1, freq
+
+
+def discount(r, t0, k, coupon, simple, par=100, second=True):
+    """以每期收益率r贴现剩余k次付息的现金流（每期利息coupon，最后一次包含本金par），各记录的k相同，返回全价及其
+    对r的一阶、二阶导数（second为False时二阶导数为None）。v ** j由累乘得到，对j的加权和以矩阵乘法计算：复利贴现时
+    第j次现金流以t0 + j期贴现，单利贴现时整期部分以j期复利贴现，不足一期的t0部分除以(1 + t0 * r)"""
+    j = np.arange(k, dtype=float)
+    vj = np.empty((len(r), k))
+    vj[:, 0] = 1
+    vj[:, 1:] = (1 / (1 + r))[:, None]
+    np.cumprod(vj, axis=1, out=vj)
+    last = par * vj[:, -1]
+    s0 = coupon * vj.sum(axis=1) + last
+    s1 = coupon * (vj @ j) + (k - 1) * last
+    s2 = coupon * (vj @ (j * j)) + (k - 1) ** 2 * last if second else None
+    p, p1 = np.empty(r.shape), np.empty(r.shape)
+    p2 = np.empty(r.shape) if second else None
+    c, s = ~simple, simple
+    # 复利贴现：sum(t * disc)与sum(t * (t + 1) * disc)按t = t0 + j展开
+    a = (1 + r[c]) ** -t0[c]
+    p[c] = a * s0[c]
+    p1[c] = -a * (t0[c] * s0[c] + s1[c]) / (1 + r[c])
+    if second:
+        p2[c] = a * ((t0[c] ** 2 + t0[c]) * s0[c] + (2 * t0[c] + 1) * s1[c] + s2[c]) / (1 + r[c]) ** 2
+    a, a1 = s0[s], -s1[s] / (1 + r[s])
+    b = 1 + t0[s] * r[s]
+    p[s] = a / b
+    p1[s] = a1 / b - t0[s] * a / b ** 2
+    if second:
+        a2 = (s1[s] + s2[s]) / (1 + r[s]) ** 2
+        p2[s] = a2 / b - 2 * t0[s] * a1 / b ** 2 + 2 * t0[s] ** 2 * a / b ** 3
+    return p, p1, p2
+
+
+def bond_derivatives(term, rate, dt0, freq, dt, ytm, par=100):
+    """按BondYTM的定价规则批量计算全价及其对每期收益率的一阶、二阶导数，1年期债券不足一期的部分按单利贴现。
+    各参数为等长数组或标量，ytm为到期收益率（%），返回全价、一阶导数、二阶导数与有效记录（未到期且收益率非nan），
+    记录按剩余付息次数分组计算"""
+    t0, n, coupon, simple, freq = bond_schedule(term, rate, dt0, freq, dt, par)
+    ytm = np.broadcast_to(np.asarray(ytm, dtype=float), t0.shape)
+    valid = (n >= 1) & ~np.isnan(ytm)
+    r = np.where(valid, ytm, 0) / (100 * freq)
+    p, p1, p2 = np.zeros(r.shape), np.zeros(r.shape), np.zeros(r.shape)
+    for k in np.unique(n[valid]):
+        i = valid & (n == k)
+        p[i], p1[i], p2[i] = discount(r[i], t0[i], k, coupon[i], simple[i], par)
+    return p, p1, p2, valid
+
+
+def bond_price_array(term, rate, dt0, freq, dt, ytm, par=100):
+    """BondYTM.bond_price的向量化版本，各参数为等长数组或标量，已到期的记录返回nan"""
+    p, _, _, valid = bond_derivatives(term, rate, dt0, freq, dt, ytm, par)
+    return np.where(valid, p, np.nan)
+
+
+def bond_ytm_array(term, rate, dt0, freq, dt, price, guess=0.03, par=100, tol=1e-12, maxiter=50):
+    """BondYTM.bond_ytm的向量化版本：付息计划只推算一次，记录按剩余付息次数分组，对全部记录同时进行牛顿迭代，
+    每次迭代只对尚未收敛的记录重新贴现。返回到期收益率（%）与是否收敛的布尔数组，未收敛或已到期的记录收益率为nan"""
+    t0, n, coupon, simple, freq = bond_schedule(term, rate, dt0, freq, dt, par)
+    shape = t0.shape
+    t0, n, coupon, simple, freq = t0.ravel(), n.ravel(), coupon.ravel(), simple.ravel(), freq.ravel()
+    price = np.broadcast_to(np.asarray(price, dtype=float), shape).ravel()
+    r = np.full(price.shape, guess, dtype=float)
+    converged = np.zeros(price.shape, dtype=bool)
+    todo = np.flatnonzero((n >= 1) & ~np.isnan(price))
+    groups = {k: todo[n[todo] == k] for k in np.unique(n[todo])}  # 剩余付息次数->尚未收敛的记录
+    for _ in range(maxiter):
+        if not groups:
+            break
+        for k, i in list(groups.items()):
+            with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+                p, p1, _ = discount(r[i], t0[i], k, coupon[i], simple[i], par, second=False)
+                step = (p - price[i]) / p1
+            r[i] -= step
+            done = np.abs(step) <= tol * np.maximum(1, np.abs(r[i]))
+            converged[i[done]] = True
+            i = i[~done & np.isfinite(step)]
+            if len(i):
+                groups[k] = i
+            else:
+                del groups[k]
+    ytm = np.where(converged, 100 * freq * r, np.nan)
+    return ytm.reshape(shape), converged.reshape(shape)
+
 
 class BondYTM(object):
     """本类用于计算续发固定利率附息国债到期收益率"""
@@ -237,8 +643,25 @@ class BondYTM(object):
         self.day0 = self.dt0.day
         self.par = par
         self.freq = freq
+        self._schedule = None
+
+    @property
+    def schedule(self):
+        """债券的付息计划，由cash_flow_schedule缓存，首次使用时取得"""
+        if self._schedule is None:
+            self._schedule = cash_flow_schedule(self.term, self.rate * 100, self.dt0, self.freq, self.par)
+        return self._schedule
 
     def get_ts(self, dt: dtt.date):
+        """返回距离最近一次付息的期数t0与剩余付息时间点序列ts，含义与get_ts_loop相同，由缓存的付息计划二分查找得到，
+        dt早于发行日或晚于到期日时按get_ts_loop逐项推算"""
+        try:
+            t0, n = self.schedule.lookup(dt)
+        except ValueError:
+            return self.get_ts_loop(dt)
+        return t0, list(range(n))
+
+    def get_ts_loop(self, dt: dtt.date):
         """本方法用于计算利息与本金支付的时间点序列，本金在最后一个时间点支付，例如一个已经发行1.75年的5年期付息国债，
         本方法分别返回一个0.25的数值和一个[0, 1, 2, 3]的列表，0.25表示距离最近的一次付息时间长度（年），[0, 1, 2, 3]
         接下来剩四次付息，距离这四次付息时间点的时间分别为0.25，1.25、2.25和3.25（年），拥有这两个结果便可以根据价格
@@ -352,19 +775,39 @@ class BondYTM(object):
 
 
 class ReadExcel(object):
-    """本类用于从Excel表格中读取数据"""
-    def __init__(self, bondtype, year, data_path, xlapp):
+    """本类用于从Excel表格中读取数据，以openpyxl的只读模式逐行读取第一张工作表，不需要Excel程序。freq为查询国债年付息
+    次数的函数，为None时年付息次数暂为None，由调用者批量查询后补充"""
+    def __init__(self, bondtype, year, data_path, freq=get_freq):
         self.bondtype = bondtype
         self.year = year
+        self.filename = self.path(bondtype, year, data_path)
+        self.freq = freq
+        self.wb = openpyxl.load_workbook(self.filename, read_only=True, data_only=True)
+        self.ws = self.wb.worksheets[0]
+
+    @staticmethod
+    def path(bondtype, year, data_path):
+        """表格类型与年份对应的excel文件路径"""
         if bondtype in ["国开债", "国债"]:
-            self.filename = data_path + r"\债券招投标结果（{}{}）.xlsx".format(bondtype, year)
+            return os.path.join(data_path, "债券招投标结果（{}{}）.xlsx".format(bondtype, year))
         elif bondtype == "QB补充":
-            self.filename = data_path + r"\利率债发行-{}.xlsx".format(year)
+            return os.path.join(data_path, "利率债发行-{}.xlsx".format(year))
         else:
             raise IndexError("错误的债券类型参数")
-        self.xlapp = xlapp
-        self.wb = xlapp.Workbooks.Open(self.filename)
-        self.ws = self.wb.Worksheets(1)
+
+    def rows(self, row, ncols):
+        """与Excel中Range(Cells(row, 1), Cells(row, ncols).End(xlDown)).Value相同：从第row行起读取前ncols列，
+        至第ncols列第一个空单元格的上一行为止"""
+        res = []
+        for values in self.ws.iter_rows(min_row=row, max_col=ncols, values_only=True):
+            values = tuple(values) + (None,) * (ncols - len(values))
+            if values[-1] is None:
+                break
+            res.append(values)
+        return res
+
+    def close(self):
+        self.wb.close()
 
     def extract(self):
         """从excel中提取数据"""
@@ -380,14 +823,15 @@ class ReadExcel(object):
         """从国债招投标结果中提取附息国债的数据"""
         cont_pattern = re.compile(r"\d{2}00\d{2}x+", re.I)
         init_pattern = re.compile(r"\d{2}00\d{2}[^xX\d]+")
-        data = self.ws.Range(self.ws.Cells(2,1), self.ws.Cells(2,31).End(4)).Value
+        data = self.rows(2, 31)
+        freq = self.freq or (lambda code: None)
         # 首发国债数据
         init = [([d[2].strftime("%Y-%m-%d"), d[0], d[4], d[29], d[28], d[10], None, self.multipliers(d[20], 2),
-                 self.mg_multipliers(d[14], d[15]), d[30], d[5], d[6], get_freq(d[0])], )
+                 self.mg_multipliers(d[14], d[15]), d[30], d[5], d[6], freq(d[0])], )
                 for d in data if re.match(init_pattern, d[0])]
         # 续发国债数据
         cont = [([d[2].strftime("%Y-%m-%d"), d[0], d[4], d[27], d[28], d[13], d[13], self.multipliers(d[20], 2),
-                 self.mg_multipliers(d[14], d[15]), d[30], d[5], d[6], get_freq(d[0])], )
+                 self.mg_multipliers(d[14], d[15]), d[30], d[5], d[6], freq(d[0])], )
                 for d in data if re.match(cont_pattern, d[0])]
         init.extend(cont)
         return init
@@ -396,7 +840,7 @@ class ReadExcel(object):
         """从利率债发行结果中提取需要的附息国债与国开债的数据"""
         p1 = re.compile(r"\d{2}附息国债")
         p2 = re.compile(r"\d{2}国开\d{2}")
-        data = self.ws.Range(self.ws.Cells(3, 1), self.ws.Cells(3, 12).End(4)).Value
+        data = self.rows(3, 12)
         res = [([self.cdt2dt(d[0]), self.name2code1(d[2]), self.term2int(d[3]), d[4], d[5], d[6], d[7],
                  self.qb_mg_multipliers(d[8]), self.cdt2dt(d[10], d[0]), self.cdt2dt(d[11], d[0])],)
                for d in data if re.match(p1, d[2])]
@@ -410,7 +854,7 @@ class ReadExcel(object):
         """从国开债招投标结果中提取国开债的数据"""
         init_pattern = re.compile(r"\d{2}02\d{2}[^ZH\d]+", re.I)
         cont_pattern = re.compile(r"\d{2}02\d{2}[ZH]+", re.I)
-        data = self.ws.Range(self.ws.Cells(2, 1), self.ws.Cells(2, 31).End(4)).Value
+        data = self.rows(2, 31)
         # 首发国开债数据
         init = [([d[2].strftime("%Y-%m-%d"), d[0], d[4], d[29], d[28], d[29], self.multipliers(d[20], 2),
                   self.mg_multipliers(d[14], d[15]), d[30], d[5], d[6]],)
@@ -509,18 +953,52 @@ class ReadExcel(object):
         return res
 
 
+def read_excel(bondtype, year, data_path):
+    """读取并提取单张excel表格，供Excel2DB.read在子进程中调用，国债的年付息次数暂为None"""
+    rd = ReadExcel(bondtype, year, data_path, freq=None)
+    try:
+        return rd.extract()
+    finally:
+        rd.close()
+
+
 class Excel2DB(object):
-    """本类用于从Excel中读取数据后写入数据库"""
-    def __init__(self, data_path, db, cur):
+    """本类用于从Excel中读取数据后写入数据库，workers为并行读取excel表格的进程数，默认为CPU个数；client为查询年付息
+    次数的Wind接口，默认为default_client()"""
+    def __init__(self, data_path, db, cur, workers=None, client=None):
         self.data_path = data_path  # 存放excel文件的路径
-        self.xlapp = win32com.client.Dispatch("Excel.Application")
         self.db = db
         self.cur = cur
+        self.workers = workers
+        self.client = client if client is not None else default_client()
+
+    def read(self, files):
+        """以进程池并行读取files中的各张表格，files为(表格类型，年份)的列表，返回{(表格类型，年份): 数据}，不存在的
+        表格被跳过并打印提示。国债的年付息次数在全部表格读取完成后一次向Wind查询"""
+        missing = [f for f in files if not os.path.exists(ReadExcel.path(*f, self.data_path))]
+        if missing:
+            print("以下表格不存在，已跳过：{}".format(missing))
+        files = [f for f in files if f not in missing]
+        if not files:
+            return {}
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+            bondtypes, years = zip(*files)
+            res = dict(zip(files, pool.map(read_excel, bondtypes, years, [self.data_path] * len(files))))
+        rows = [d[0] for (bondtype, _), data in res.items() if bondtype == "国债" for d in data]
+        if rows:
+            codes = sorted(set(r[1] for r in rows))
+            freqs = dict(zip(codes, get_freqs(codes, self.client)))
+            for r in rows:
+                r[12] = freqs[r[1]]
+        return res
 
-    def insert1(self, bondtype, year):
-        """按表格类型与年份将单张excel表格写入数据库"""
-        rd = ReadExcel(bondtype, year, self.data_path, self.xlapp)
-        data = rd.extract()
+    def insert1(self, bondtype, year, upsert=False, data=None):
+        """按表格类型与年份将单张excel表格写入数据库，upsert为True时已存在的债券被更新而不是报错；data为已由read读取的
+        数据，为None时在本进程中读取"""
+        if data is None:
+            rd = ReadExcel(bondtype, year, self.data_path, functools.partial(get_freq, client=self.client))
+            data = rd.extract()
+            rd.close()
         if bondtype == "国债":
             table = "tb_pri"
         elif bondtype == "QB补充":
@@ -530,6 +1008,10 @@ class Excel2DB(object):
         else:
             table = None
         sql = "insert into {} values %s".format(table)
+        if upsert:
+            # 代码先按insert中的规则修正，否则与库中已修正的代码不能匹配
+            data = [([d[0][0], self.clean_code(d[0][1]), *d[0][2:]],) for d in data]
+            sql = upsert_sql(table)
         try:
             _ = self.cur.executemany(sql, data)
         except pymysql.err.IntegrityError as e:
@@ -537,6 +1019,7 @@ class Excel2DB(object):
             print(bondtype, year, e)
         else:
             self.db.commit()
+            bump(table)
 
     def insert2(self, dt1='2017-7-29', dt2='2017-11-21'):
         """从wind数据库上下载的国债招投标结果缺失了2017年7月29日至11月21日之间的数据，可从QB的表格内补充该部分数据
@@ -548,16 +1031,23 @@ class Excel2DB(object):
         sql2 = """select code from appendix1 where dt between %s and %s"""
         self.cur.execute(sql, (dt1, dt2))
         codes = Data(sql2, self.cur, (dt1, dt2)).select_col(0)
-        data = [(get_freq(code), code) for code in codes]
+        data = list(zip(get_freqs(codes, self.client), codes)) if codes else []
         self.cur.executemany(sql1, data)
         self.db.commit()
+        bump("tb_pri")
 
-    def insert(self, years):
-        for year in years:
-            self.insert1("国债", year)
-            self.insert1("QB补充", year)
-            # self.insert1("国开债", year)
-        if 2017 in years:
+    @staticmethod
+    def clean_code(code):
+        """与insert中的update语句相同：代码改为大写，XX结尾的续发债代码改为X2"""
+        return re.sub(r"^(.{6})XX\.IB$", r"\1X2.IB", code.upper())
+
+    def insert(self, years, upsert=False):
+        files = [(bondtype, year) for year in years for bondtype in ["国债", "QB补充"]]  # "国开债"
+        data = self.read(files)
+        for bondtype, year in files:
+            if (bondtype, year) in data:
+                self.insert1(bondtype, year, upsert, data[(bondtype, year)])
+        if 2017 in years and not upsert:
             self.insert2()
         upper_sql = """update tb_pri set code = upper(code)"""
         XX__sql = """update tb_pri set code = concat(left(code, 6), "X2.IB") where code regexp '.{6}XX.IB'"""
@@ -565,6 +1055,22 @@ class Excel2DB(object):
         self.cur.execute(XX__sql)
         self.cur.execute("delete from tb_pri where term = 0.5") # 有一只国开债剩余期限0.5年，要删掉
         self.db.commit()
+        bump("tb_pri")
+
+    def sync(self, years=None):
+        """增量同步：只重新读取tb_pri中最新发行日期所在年份至今年的表格并以upsert写入，再记录tb_pri与appendix1的
+        同步水位，尚不存在的表格（例如年初今年的表格）被跳过。tb_pri为空时应先以insert全量写入"""
+        if years is None:
+            last = Data("select max(dt) from tb_pri", self.cur).data[0][0]
+            if last is None:
+                raise ValueError("tb_pri中没有数据，请先以insert全量写入")
+            years = range(as_datetime(last).year, dtt.date.today().year + 1)
+        self.insert(years, upsert=True)
+        for table in ["tb_pri", "appendix1"]:
+            last = Data("select max(dt) from {}".format(table), self.cur).data[0][0]
+            set_watermark(self.cur, table, table, last and as_datetime(last), None)
+        self.db.commit()
+        bump("watermark")
 
     def update(self, mode=0):
         """由于从WIND下载的17年7月之后的招投标结果缺少边际利率，全场倍数与边际倍数,有的缺少中标利率，因此可以使用QB的数据来进行补充
@@ -590,6 +1096,7 @@ class Excel2DB(object):
             self.db.rollback()
         else:
             self.db.commit()
+            bump("tb_pri")
 
     def update_mg_rate(self):
         """在续发国债招标发行中，Wind给出的边际利率其实是价格，需要转换为利率，借助BondYIM类可以做到将价格转换为收益率"""
@@ -613,7 +1120,11 @@ class Excel2DB(object):
         # for d in data:
         #     print(d[2], d[7], d[5], d[0], d[4], d[1], end="     ")
         #     print(BondYTM(d[2], d[7], d[5]).bond_ytm(d[0], d[4]))
-        data_update1 = [[BondYTM(d[2], d[7], d[5], d[8]).bond_ytm(d[9], d[4]), d[1]] for d in data1]
+        data_update1 = []
+        if data1:
+            d = list(zip(*data1))
+            ytm, _ = bond_ytm_array(d[2], d[7], d[5], [f or 1 for f in d[8]], d[9], d[4])
+            data_update1 = [[float(y), code] for y, code in zip(ytm, d[1]) if np.isfinite(y)]
         sql_update1 = """update tb_pri set mg_rate = %s where code = %s"""
         try:
             _ = self.cur.execute(sql_update0)
@@ -622,6 +1133,7 @@ class Excel2DB(object):
             self.db.rollback()
         else:
             self.db.commit()
+            bump("tb_pri")
 
     def update_mg_price(self):
         """计算边际中标价格，原理类似于update_mg_rate，注意实际创建数据库时，该方法须在update_mg_rate运行之后使用"""
@@ -636,7 +1148,11 @@ class Excel2DB(object):
                       and t3.dt_pay is not null
                       """
         data2 = Data(sql_select2, self.cur).data
-        data_update2 = [[BondYTM(d[2], d[7], d[5], d[8]).bond_price(d[9], d[4]), d[1]] for d in data2]
+        data_update2 = []
+        if data2:
+            d = list(zip(*data2))
+            price = bond_price_array(d[2], d[7], d[5], [f or 1 for f in d[8]], d[9], d[4])
+            data_update2 = [[float(p), code] for p, code in zip(price, d[1]) if np.isfinite(p)]
         sql_update2 = """update tb_pri set mg_price = %s where code = %s"""
         try:
             _ = self.cur.executemany(sql_update2, data_update2)
@@ -644,6 +1160,7 @@ class Excel2DB(object):
             self.db.rollback()
         else:
             self.db.commit()
+            bump("tb_pri")
 
     def update_price(self):
         """由appendix1补录的数据（2017/7/29-2017/11/21）缺少price信息，需要自己计算，计算由BondYTM负责"""
@@ -654,7 +1171,11 @@ class Excel2DB(object):
                       where t2.dt between '2017-7-29' and '2017-11-21'
                       """
         data = Data(sql_select, self.cur).data
-        data_update = [[BondYTM(d[2], d[3], d[0], d[7]).bond_price(d[8], d[6]), d[5]] for d in data]
+        data_update = []
+        if data:
+            d = list(zip(*data))
+            price = bond_price_array(d[2], d[3], d[0], [f or 1 for f in d[7]], d[8], d[6])
+            data_update = [[float(p), code] for p, code in zip(price, d[5]) if np.isfinite(p)]
         sql_update = "update tb_pri set price = %s where code = %s"
         for d in data_update:
             print(d)
@@ -664,88 +1185,121 @@ class Excel2DB(object):
             self.db.rollback()
         else:
             self.db.commit()
+            bump("tb_pri")
 
 
 class Wind2DB(object):
-    """Wind2DB类主要用于从Wind数据库中提取所需数据并写入数据库"""
-    def __init__(self, db, cur):
+    """Wind2DB类主要用于从Wind数据库中提取所需数据并写入数据库，client为Wind接口（wind.WindClient），默认调用WindPy，
+    可替换为wind.FakeWind等本地实现；workers为并发请求的线程数，batch为每个请求的最多代码数，chunk为每次提交的行数，
+    loader为写入数据库的bulkload.BulkLoader，默认以多行insert语句写入"""
+    tb_sec_fields = ["yield_cnbd", "net_cnbd", "dirty_cnbd"]
+    first = dtt.date(2013, 1, 1)  # 全量提取的开始日期
+    futures = {"TF.CFE": (5, "2013-9-6"), "T.CFE": (10, "2015-3-20")}  # 国债期货合约代码->(期限，上市日期)
+    rate_codes = {"国债": ["S0059744", "S0059745", "S0059746", "S0059747", "S0059748", "S0059749", "S0059751",
+                         "S0059752", "M1000170"],
+                  "国开债": ["M1004263", "M1004264", "M1004265", "M1004267", "M1004269", "M1004271", "M1004273",
+                          "M1004274", "M1004275"]}
+    rate_terms = [1, 2, 3, 5, 7, 10, 20, 30, 50]
+    money_codes = ("FR007.IR", "SHIBOR3M.IR", "SHIBORON.IR")
+    sync_tables = ["dts1", "dts2", "tb_rate", "money", "future", "future_minute"]
+    series_cols = {"tb_rate": 2, "money": 1, "future": 5, "future_minute": 1, "dts1": None, "dts2": None}
+
+    def __init__(self, db, cur, client=None, workers=4, batch=50, chunk=5000, loader=None):
         self.db = db
         self.cur = cur
+        self.client = client if client is not None else default_client()
+        self.workers = workers
+        self.batch = batch
+        self.chunk = chunk
+        self.loader = loader if loader is not None else BulkLoader(db, cur, commit_every=chunk)
+
+    def plan_tb_sec(self):
+        """规划get_data_tb_sec的Wind请求：续发债按发行日的前一交易日至发行后第10个交易日的区间分组，
+        返回{(开始日期，结束日期): [(首发债代码，续发债代码，期限), ...]}"""
+        data = Data("select code, dt, term from tb_pri", self.cur).data
+        counts = collections.Counter(d[0][:6] for d in data)
+        calendar = tradedays.calendar(self.cur, "dts2")
+        plan = {}
+        for code, dt, term in data:
+            # 与原先的regexp '代码前6位[XZH]'相同，只选取有续发的首发债对应的续发债
+            if counts[code[:6]] > 1 and re.match(r".{6}[XZH]", code):
+                window = (calendar.offset(dt, -1), calendar.offset(dt, 10))
+                plan.setdefault(window, []).append((code[:6] + ".IB", code, term))
+        return plan
 
     def get_data_tb_sec(self):
-        """本方法用于提取续发债发行日的前一交易日至发行后四个交易日（共6个交易日）的债券二级市场中债估值收益率"""
-        sql1 = """select concat(left(code, 6), ".IB") as code_init, count(*) as num from tb_pri 
-            group by left(code, 6) having num>1"""
-        codes_init = Data(sql1, self.cur).select_col(0)
-        # 利用首发债代码筛选出对应的续发债的发行日期
-        data = []
-        for code_init in codes_init:
-            p = code_init[0:6] + "[XZH]"
-            sql2 = """select code, dt, term from tb_pri where code regexp %s"""
-            datum = Data(sql2, self.cur, p).data
-            for d in datum:
-                # print(d)
-                res = w.wsd(code_init, "yield_cnbd,net_cnbd,dirty_cnbd", dt_offset(self.cur, d[1], -1),
-                            dt_offset(self.cur, d[1], 10),
-                            "credibility=1;TradingCalendar=NIB")
-                try:
-                    ys, ns, ds = res.Data
-                except ValueError as e:
-                    print(d[0], d[1], e)
-                    raise ValueError(e)
-                seq = range(len(ys))
-                dts = res.Times
-                for y, n, dd, dt, s in zip(ys, ns, ds, dts, seq):
-                    data.append(([dt, d[0], code_init, d[2], None if math.isnan(y) else y,
-                                  None if math.isnan(n) else n, None if math.isnan(dd) else dd, s],))
-        return data
-
-    @staticmethod
-    def get_data_tb_rate(dt1="2013-1-1", dt2="2019-1-31"):
-        """本方法用于从WIND获取国债与国开债的期限利率的中债估值，共9个期限，分别是1Y 2Y 3Y 5Y 7Y 10Y 20Y 30Y 50Y"""
-        code1 = ["S0059744", "S0059745", "S0059746", "S0059747", "S0059748", "S0059749", "S0059751",
-                 "S0059752", "M1000170"]
-        code2 = ["M1004263", "M1004264", "M1004265", "M1004267", "M1004269", "M1004271", "M1004273",
-                 "M1004274", "M1004275"]
-        codes = [code1, code2]
-        bond_type = ["国债", "国开债"]
+        """本方法用于提取续发债发行日的前一交易日至发行后第10个交易日的债券二级市场中债估值收益率、净价与全价。
+        同一区间的首发债合并为多代码请求（Wind不支持多代码多字段，因此每个字段一个请求，只有一只债券时合并为一个
+        多字段请求），由线程池并发执行并在失败时重试，结果逐行输出"""
+        plan = self.plan_tb_sec()
+        fields = self.tb_sec_fields
+        requests = []
+        for window, items in plan.items():
+            codes = sorted(set(d[0] for d in items))
+            for k in range(0, len(codes), self.batch):
+                chunk = tuple(codes[k:k + self.batch])
+                for fs in ([fields] if len(chunk) == 1 else [[f] for f in fields]):
+                    requests.append(((window, chunk, tuple(fs)), "wsd", (",".join(chunk), ",".join(fs), *window,
+                                                                         "credibility=1;TradingCalendar=NIB")))
+        received = {}
+        for (window, chunk, fs), res in fetch_all(self.client, requests, self.workers):
+            # 多代码请求的Data按代码排列，单代码多字段请求的Data按字段排列
+            series = received.setdefault((window, chunk), {})
+            if len(fs) == 1:
+                series[fs[0]] = dict(zip(chunk, res.Data))
+            else:
+                series.update((f, {chunk[0]: d}) for f, d in zip(fs, res.Data))
+            series["dts"] = res.Times
+            if len(series) <= len(fields):
+                continue
+            received.pop((window, chunk))
+            values = [series[f] for f in fields]
+            dts = series["dts"]
+            for code_init, code, term in plan[window]:
+                if code_init not in chunk:
+                    continue
+                for s, dt in enumerate(dts):
+                    y, n, dd = [None if math.isnan(v[code_init][s]) else v[code_init][s] for v in values]
+                    yield ([dt, code, code_init, term, y, n, dd, s],)
+
+    def get_data_tb_rate(self, dt1="2013-1-1", dt2="2019-1-31", starts=None):
+        """本方法用于从WIND获取国债与国开债的期限利率的中债估值，共9个期限，分别是1Y 2Y 3Y 5Y 7Y 10Y 20Y 30Y 50Y。
+        starts为{债券类型: 开始日期}，只提取其中的债券类型，默认两种债券类型均从dt1开始"""
+        starts = starts or dict.fromkeys(self.rate_codes, dt1)
         data = []
-        terms = [1, 2, 3, 5, 7, 10, 20, 30, 50]
-        for m in range(len(codes)):
-            res_w = w.edb(codes[m], dt1, dt2, "Fill=Previous")
-            for n in range(len(terms)):
-                d = [([res_w.Times[i], terms[n], bond_type[m], res_w.Data[n][i]],) for i in range(len(res_w.Times))]
+        for bond_type, dt in starts.items():
+            res_w = fetch(self.client, "edb", self.rate_codes[bond_type], dt, dt2, "Fill=Previous")
+            for n in range(len(self.rate_terms)):
+                d = [([res_w.Times[i], self.rate_terms[n], bond_type, res_w.Data[n][i]],)
+                     for i in range(len(res_w.Times))]
                 data.extend(d)
         return data
 
-    @staticmethod
-    def get_data_future(dt="2019-1-31"):
-        """本函数用于从WIND获取建立国债期货结算价与收盘价表格所需的数据,包括TF与T合约"""
-        wd_tf = w.wsd("TF.CFE", "settle,close", "2013-9-6", dt, "")
-        wd_t =  w.wsd("TF.CFE", "settle,close", "2015-3-20", dt, "")
-        wds = [wd_tf, wd_t]
-        terms = [5, 10]
+    def get_data_future(self, dt="2019-1-31", starts=None, seqs=None):
+        """本函数用于从WIND获取建立国债期货结算价与收盘价表格所需的数据,包括TF与T合约。starts为{合约代码: 开始日期}，
+        默认为各合约的上市日期；seqs为{合约代码: 第一个日期的顺序号}，默认为0"""
+        starts = starts or {code: start for code, (_, start) in self.futures.items()}
+        seqs = seqs or {}
         data = []
-        for m in range(len(terms)):
-            wd = list(zip(wds[m].Times, p2y_future(wds[m].Data[0], terms[m]), p2y_future(wds[m].Data[1], terms[m]),
-                          wds[m].Data[0], wds[m].Data[1]))
-            d=[([*wd[i], terms[m], i],) for i in range(len(wd))]
-            data.extend(d)
+        for code, start in starts.items():
+            term = self.futures[code][0]
+            wd = fetch(self.client, "wsd", code, "settle,close", start, dt, "")
+            wd = list(zip(wd.Times, p2y_future(wd.Data[0], term), p2y_future(wd.Data[1], term), wd.Data[0], wd.Data[1]))
+            seq0 = seqs.get(code, 0)
+            data.extend([([*wd[i], term, seq0 + i],) for i in range(len(wd))])
         return data
 
     def get_data_payment(self):
         sql = r"select distinct code0 from tb_sec"
         codes = Data(sql, self.cur).select_col(0)
-        wdata = w.wss(codes, "maturitydate,couponrate", "N=0")
+        wdata = fetch(self.client, "wss", codes, "maturitydate,couponrate", "N=0")
         data = [(d,) for d in list(zip(wdata.Codes, wdata.Data[0], wdata.Data[1]))]
         return data
 
-    @staticmethod
-    def get_data_money(dt1=dtt.date(2013, 1, 1), dt2=dtt.date(2019, 1, 31),
-                       codes=("FR007.IR", "SHIBOR3M.IR", "SHIBORON.IR")):
+    def get_data_money(self, dt1=dtt.date(2013, 1, 1), dt2=dtt.date(2019, 1, 31), codes=None):
         """从Wind提取货币市场利率数据"""
         res = []
-        data = w.wsd(codes, "close", dt1, dt2, "TradingCalendar=NIB")
+        data = fetch(self.client, "wsd", list(codes or self.money_codes), "close", dt1, dt2, "TradingCalendar=NIB")
         for i in range(len(data.Codes)):
             code = data.Codes[i]
             for j in range(len(data.Times)):
@@ -753,59 +1307,110 @@ class Wind2DB(object):
                 res.append(([data.Times[j], code, d],))
         return res
 
-    @staticmethod
-    def get_data_future_minute(codes=("TF.CFE", "T.CFE"), barsize=5,
-                               dt=dtt.datetime(2019, 1, 31, 15, 16, 00)):
-        """从Wind提取分钟序列"""
+    def get_data_future_minute(self, codes=("TF.CFE", "T.CFE"), barsize=5,
+                               dt=dtt.datetime(2019, 1, 31, 15, 16, 00), starts=None):
+        """从Wind提取分钟序列。starts为{合约代码: 开始时间}，默认为各合约上市日的9:15，开始时间应为某个交易日的
+        9:15，以保证顺序号（每日54个5分钟行情）与原先一致"""
         res = list()
+        starts = starts or {}
         for code in codes:
-            if code == "T.CFE":
-                dt1 = dtt.datetime(2013, 9, 6, 9, 15, 00)
-                term = 10
-            elif code == "TF.CFE":
-                dt1 = dtt.datetime(2015, 3, 20, 9, 15, 00)
-                term = 5
-            else:
+            if code not in self.futures:
                 raise ValueError("错误的codes参数类型")
+            term, listed = self.futures[code]
+            dt1 = starts.get(code, dtt.datetime.combine(pd.Timestamp(listed).date(), dtt.time(9, 15)))
             BarSize = "BarSize={}".format(barsize)
-            wdata = w.wsi(code, "close", dt1, dt, BarSize)
-            seq = 0
-            data = []
-            for d in zip(wdata.Times, wdata.Data[0]):
-                data.append(([d[0], term, d[1], p2y_future(d[1], term), seq],))
-                seq += 1
-                if seq == 54:
-                    seq = 0
+            wdata = fetch(self.client, "wsi", code, "close", dt1, dt, BarSize)
+            rates = p2y_future(wdata.Data[0], term)
+            data = [([d[0], term, d[1], d[2], i % 54],) for i, d in enumerate(zip(wdata.Times, wdata.Data[0], rates))]
             res.extend(data)
         return res
 
-    @staticmethod
-    def get_data_dts1(dt1="2013-1-1", dt2="2019-1-31"):
-        """从Wind提取交易所的交易日序列"""
-        wdata = w.tdays(dt1, dt2, "")
+    def get_data_dts1(self, dt1="2013-1-1", dt2="2019-1-31", seq0=0):
+        """从Wind提取交易所的交易日序列，seq0为第一个交易日的顺序号"""
+        wdata = fetch(self.client, "tdays", dt1, dt2, "")
         d = wdata.Data[0]
         n = len(d)
-        data = [([d[i].date(), i],) for i in range(n)]
+        data = [([d[i].date(), seq0 + i],) for i in range(n)]
         return data
 
-    @staticmethod
-    def get_data_dts2(dt1="2013-1-1", dt2="2019-1-31"):
-        """从Wind提取银行间的交易日序列"""
-        wdata = w.tdays(dt1, dt2, "TradingCalendar=NIB")
+    def get_data_dts2(self, dt1="2013-1-1", dt2="2019-1-31", seq0=0):
+        """从Wind提取银行间的交易日序列，seq0为第一个交易日的顺序号"""
+        wdata = fetch(self.client, "tdays", dt1, dt2, "TradingCalendar=NIB")
         d = wdata.Data[0]
         n = len(d)
-        data = [([d[i].date(), i],) for i in range(n)]
+        data = [([d[i].date(), seq0 + i],) for i in range(n)]
         return data
 
+    def write(self, table, rows, upsert=False):
+        """由loader将rows分批写入table并按批提交，upsert为True时主键已存在的记录被更新而不是报错，返回写入的行数"""
+        return self.loader.load(table, rows, upsert)["rows"]
+
     def insert(self, table=None):
-        if table:
-            data = eval("self.get_data_{}()".format(table))
-            self.cur.executemany(r"insert into {} values %s".format(table), data)
-        else:
-            for t in ["dts1", "dts2", "tb_sec", "tb_rate", "future", "payment", "money", "future_minute"]:
-                data = eval("self.get_data_{}()".format(t))
-                self.cur.executemany(r"insert into {} values %s".format(t), data)
+        tables = [table] if table else ["dts1", "dts2", "tb_sec", "tb_rate", "future", "payment", "money",
+                                        "future_minute"]
+        for t in tables:
+            # get_data_tb_sec逐行输出，按chunk行分批写入并提交，不在内存中保留全部数据
+            self.write(t, eval("self.get_data_{}()".format(t)))
+        self.db.commit()
+        bump(*tables)
+        tradedays.reset(*[t for t in tables if t in ("dts1", "dts2")])
+
+    def watermarks(self, table):
+        """表中各序列已有数据的最新日期（datetime）与最大顺序号，返回{序列: (最新日期，最大顺序号)}。序列为债券类型
+        （tb_rate）、代码（money）、期限（future与future_minute）或表名（dts1与dts2），表中没有顺序号时为None"""
+        sql = {"tb_rate": "select bond_type, max(dt), null from tb_rate group by bond_type",
+               "money": "select code, max(dt), null from money group by code",
+               "future": "select term, max(dt), max(seq) from future group by term",
+               "future_minute": "select term, max(dtt), null from future_minute group by term",
+               "dts1": "select 'dts1', max(dt), max(seq) from dts1",
+               "dts2": "select 'dts2', max(dt), max(seq) from dts2"}
+        if table not in sql:
+            raise ValueError("{}不支持增量同步".format(table))
+        return {d[0]: (as_datetime(d[1]), d[2]) for d in Data(sql[table], self.cur).data if d[1] is not None}
+
+    def get_delta(self, table, dt):
+        """table在各序列最新日期之后、dt（含）之前缺失的数据，已是最新的序列不发出请求"""
+        marks = self.watermarks(table)
+        next_day = {k: (v[0] + dtt.timedelta(1)).date() for k, v in marks.items()}
+        if table in ("dts1", "dts2"):
+            start = next_day.get(table, self.first)
+            seq0 = marks[table][1] + 1 if table in marks else 0
+            return eval("self.get_data_{}".format(table))(start, dt, seq0) if start <= dt else []
+        if table == "tb_rate":
+            starts = {k: next_day.get(k, self.first) for k in self.rate_codes}
+            starts = {k: v for k, v in starts.items() if v <= dt}
+            return self.get_data_tb_rate(dt2=dt, starts=starts) if starts else []
+        if table == "money":
+            start = min(next_day.get(k, self.first) for k in self.money_codes)
+            return self.get_data_money(start, dt, self.money_codes) if start <= dt else []
+        terms = {term: code for code, (term, _) in self.futures.items()}
+        if table == "future":
+            starts = {code: next_day.get(term, pd.Timestamp(self.futures[code][1]).date()) for term, code in terms.items()}
+            starts = {k: v for k, v in starts.items() if v <= dt}
+            seqs = {terms[k]: v[1] + 1 for k, v in marks.items()}
+            return self.get_data_future(dt, starts, seqs) if starts else []
+        # future_minute的顺序号为日内位置，因此从最新时间所在交易日的第一个行情重新提取，该日已有的记录被更新
+        starts = {terms[k]: dtt.datetime.combine(v[0].date(), dtt.time(9, 15)) for k, v in marks.items()}
+        codes = [code for term, code in terms.items() if term not in marks or marks[term][0].date() <= dt]
+        return self.get_data_future_minute(codes, dt=dtt.datetime.combine(dt, dtt.time(15, 16)), starts=starts)
+
+    def sync(self, tables=None, dt=None):
+        """增量同步：读取各表每个序列的最新日期，只从Wind提取其后缺失的数据并以upsert写入，再在watermark表中记录
+        各序列的同步水位。dt为同步的截止日期，默认为今天，返回{表名: 写入的行数}"""
+        dt = pd.Timestamp(dt or dtt.date.today()).date()
+        tables = tables or self.sync_tables
+        res = {}
+        for t in tables:
+            rows = self.get_delta(t, dt)
+            res[t] = self.write(t, rows, upsert=True)
+            col = self.series_cols[t]
+            counts = collections.Counter(t if col is None else r[0][col] for r in rows)
+            for series, (last, _) in self.watermarks(t).items():
+                set_watermark(self.cur, t, series, last, counts[series])
         self.db.commit()
+        bump(*tables, "watermark")
+        tradedays.reset(*[t for t in tables if t in ("dts1", "dts2")])
+        return res
 
 
 class DB2self(object):
@@ -856,19 +1461,51 @@ class DB2self(object):
             for name in ["imp_delta", "imp_dprice"]:
                 self.cur.execute(eval("sql_{}".format(name)))
 
-    def insert_tb_sec_delta(self):
-        sql1 = r"""
-        insert into tb_sec_delta(dt, code, code0, term, seq)
-        select dt, code, code0, term, seq from tb_sec
-        """
-        sql2 = r"""update tb_sec_delta set delta = imp_delta(code, seq), dprice = imp_dprice(code, seq)"""
+    # 由tb_sec自连接计算的tb_sec_delta记录，{}处为筛选条件
+    sql_delta = r"""
+    select t1.dt, t1.code, t1.code0, t1.term,
+    round(100 * (case when t1.seq = 0 then t3.rate - t1.yield else t1.yield - t2.yield end), 2) as delta,
+    round(case when t1.seq = 0 then t3.price - t1.net else t1.net - t2.net end, 4) as dprice,
+    t1.seq
+    from tb_sec t1 left join tb_sec t2 on t1.code = t2.code and t2.seq = t1.seq - 1
+    left join tb_pri t3 on t1.code = t3.code
+    {}
+    """
+
+    def changed_codes(self, tol=5e-5):
+        """tb_sec中与tb_sec_delta不一致的续发债代码：由tb_sec重新计算的记录在tb_sec_delta中缺少，或日期、首发代码、
+        期限不同，或delta、dprice之差超过tol（tb_sec以更新方式同步时估值被原地改写），以及tb_sec_delta中有而tb_sec中
+        已不存在的记录"""
+        sql = r"""
+        select t1.code from ({}) t1 left join tb_sec_delta t2 on t1.code = t2.code and t1.seq = t2.seq
+        where t2.code is null or t1.dt <> t2.dt or t1.code0 <> t2.code0 or t1.term <> t2.term
+        or (t1.delta is null) <> (t2.delta is null) or abs(t1.delta - t2.delta) > %s
+        or (t1.dprice is null) <> (t2.dprice is null) or abs(t1.dprice - t2.dprice) > %s
+        union
+        select t2.code from tb_sec_delta t2 left join tb_sec t1 on t1.code = t2.code and t1.seq = t2.seq
+        where t1.code is null
+        """.format(self.sql_delta.format(""))
+        return Data(sql, self.cur, (tol, tol)).select_col(0)
+
+    def insert_tb_sec_delta(self, codes=None):
+        """由tb_sec计算续发债每个交易日的估值收益率变化（BP）与净价变化，写入tb_sec_delta。以(code, seq - 1)的自连接
+        一次计算全部记录，结果与函数imp_delta、imp_dprice相同：seq为0时为中标利率（价格）与当日估值之差，其余为与前一
+        交易日估值之差，分别保留2位与4位小数。只重建codes中的债券，默认为changed_codes中的债券，返回重建的债券个数"""
+        codes = self.changed_codes() if codes is None else list(codes)
+        if not codes:
+            return 0
+        sql1 = r"""delete from tb_sec_delta where code in %s"""
+        sql2 = r"""insert into tb_sec_delta(dt, code, code0, term, delta, dprice, seq) """ + \
+            self.sql_delta.format("where t1.code in %s")
         try:
-            self.cur.execute(sql1)
-            self.cur.execute(sql2)
+            self.cur.execute(sql1, (codes,))
+            self.cur.execute(sql2, (codes,))
         except:
             self.db.rollback()
+            raise
         else:
             self.db.commit()
+        return len(codes)
 
     def insert_future_delta(self):
         sql = r"""
@@ -878,50 +1515,50 @@ class DB2self(object):
         from future t1 inner join future t2 on t1.term = t2.term and t1.seq= t2.seq+1"""
         self.cur.execute(sql)
 
-    def insert_impact(self):
-        """向数据库中的impact表插入数据"""
+    def insert_impact(self, incremental=False):
+        """向数据库中的impact表插入数据：由续发国债的中标价格与边际中标价格（扣除返费）计算收益率，与发行日中债估值
+        之差即为发行冲击（BP）。全部记录一次读入后以bond_ytm_array同时计算，incremental为True时只计算招标日期晚于
+        impact中最新日期的记录，已存在的记录被更新"""
         sql1 = """
         select t1.dt, t1.code, t1.term, t1.price, t1.mg_price, t1.pay_times, t2.code, t2.dt, t2.rate, t3.yield, 
         t4.dt_pay,t1.bond_type 
         from tb_pri t1 inner join tb_pri t2 inner join tb_sec t3 inner join appendix1 t4
         on t1.code = t3.code and t2.code = t3.code0 and t1.code = t4.code and t3.seq = 0
-        where t1.bond_type = '国债' and t1.mg_price is not null
+        where t1.bond_type = '国债' and t1.mg_price is not null and t1.price is not null and t4.dt_pay is not null
+        and t1.dt > %s
         """
-        data1 = Data(sql1, self.cur).data
-        data = []
-        for d in data1:
-            if d[3] is None:
-                continue
-            bond = BondYTM(d[2], d[8], d[7], d[5])
-            price = d[3]
-            mg_price = d[4]
-            if d[2] in [3]:
-                a = 0.05  # 2年期国债返费为5分钱
-            elif d[2] in [5, 7, 10, 30]:
-                a = 0.1  # 5、7、10、30年期国债返费为0.1元
-            else:
-                a = 0
-            ytm = bond.bond_ytm(d[10], price - a)
-            mg_ytm = bond.bond_ytm(d[10], mg_price - a)
-            dd = ([d[0], d[1], d[6], d[2], 100 * (ytm - d[9]), 100 * (mg_ytm - d[9]), d[11]],)
-            data.append(dd)
-        sql2 = "insert into impact values %s"
-        self.cur.executemany(sql2, data)
+        last = Data("select max(dt) from impact", self.cur).data[0][0] if incremental else None
+        data1 = Data(sql1, self.cur, last or dtt.date(1900, 1, 1)).data
+        if not data1:
+            return 0
+        d = list(zip(*data1))
+        term = np.array(d[2], dtype=float)
+        # 返费：3年期国债为5分钱，5、7、10、30年期国债为0.1元，其余为0
+        rebate = np.select([np.isin(term, [3]), np.isin(term, [5, 7, 10, 30])], [0.05, 0.1], 0)
+        price = np.array([d[3], d[4]], dtype=float) - rebate
+        # 中标价格与边际中标价格合并为一个数组同时求解，结果的两行分别对应两者
+        bond = [np.tile(np.asarray(x), 2) for x in (term, d[8], d[7], [f or 1 for f in d[5]], d[10])]
+        ytm = bond_ytm_array(*bond, price.ravel())[0].reshape(price.shape)
+        delta = 100 * (ytm - np.array(d[9], dtype=float))
+        data = [([d[0][i], d[1][i], d[6][i], d[2][i], *[None if np.isnan(x) else float(x) for x in delta[:, i]],
+                  d[11][i]],) for i in range(len(data1))]
+        self.cur.executemany(upsert_sql("impact"), data)
+        return len(data)
 
     def insert(self, table=None):
-        if table:
-            eval(r"self.insert_{}()".format(table))
-        else:
-            for t in ["tb_sec_delta", "future_delta", "impact"]:
-                eval(r"self.insert_{}()".format(t))
+        tables = [table] if table else ["tb_sec_delta", "future_delta", "impact"]
+        for t in tables:
+            eval(r"self.insert_{}()".format(t))
         self.db.commit()
+        bump(*tables)
 
 
 def main():
     # data_path = r"f:\reports\my report\report1\数据"  # excel数据文件存放路径
     # data_path = r"C:\Users\daidi\Documents\我的研究报告\利率债一级市场与二级市场关系研究\数据"  # excel数据文件存放路径
-    db = pymysql.connect("localhost", "root", "root", charset="utf8")
-    cur = db.cursor()
+    # 数据库可能尚未创建，连接时不指定数据库
+    pool = ConnectionPool(size=1, database=None)
+    db = cur = pool.session()
     _ = cur.execute("use strategy1")
     w.start()
     # create_database(cur, None)
@@ -940,7 +1577,7 @@ def main():
         # db2self.insert("impact")
     finally:
         cur.close()
-        db.close()
+        pool.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,107 @@
+# engine.py为事件驱动的回测内核，将指令单、付息、兑付与每日估值统一放入按时间排序的事件队列，由Position逐个处理
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import heapq
+import itertools
+import numpy as np
+import pandas as pd
+import datetime as dtt
+from backtest import Order, MarketData, Position
+
+# 同一日内的事件处理顺序：先付息兑付，再成交指令单，最后按收盘估值
+COUPON = 0
+ORDER = 1
+MARK = 2
+
+
+class EventEngine(object):
+    """事件驱动回测引擎，事件以(时间，优先级，序号，处理函数，参数)的形式存放在堆中，来自不同策略的指令单可以按任意
+    顺序加入（schedule之前或之后均可，但应在run之前），由堆自动归并为时间顺序。每日估值事件产生的账户价值以生成器的
+    形式逐日输出"""
+    def __init__(self, position: Position, market: MarketData):
+        self.position = position
+        self.market = market
+        self.queue = []
+        self.counter = itertools.count()  # 相同时间与优先级的事件按加入顺序处理
+        self.symbols = list(position.ps)
+        self.prices = None
+        self.dt1 = self.dt2 = None
+        self.dt_index = {}
+        self.symbol_index = {}
+
+    def put(self, time, priority, handler, *args):
+        """加入一个事件"""
+        heapq.heappush(self.queue, (time, priority, next(self.counter), handler, args))
+
+    def add_orders(self, orders):
+        """加入指令单，指令单不必按时间排序。schedule之后加入的新品种，由extend补充其价格与付息、兑付事件"""
+        new = []
+        for order in orders:
+            if order.symbol not in self.symbols:
+                self.symbols.append(order.symbol)
+                new.append(order.symbol)
+            self.put(order.time, ORDER, self.on_order, order)
+        if new and self.prices is not None:
+            self.extend(new)
+
+    def extend(self, symbols):
+        """在已载入的价格矩阵中为新品种symbols增加价格列，并加入这些品种在(dt1, dt2]之间的付息、兑付事件"""
+        prices, dts = self.market.get_price_matrix(symbols, self.dt1, self.dt2 + dtt.timedelta(1))
+        cols = np.full((len(self.dt_index), len(symbols)), np.nan)
+        for k, dt in enumerate(dts):
+            if dt in self.dt_index:
+                cols[self.dt_index[dt]] = prices[k]
+        self.prices = np.hstack([self.prices, cols])
+        for symbol in symbols:
+            self.symbol_index[symbol] = len(self.symbol_index)
+        for code, dt, flow, redeemed in self.market.get_paymentdt(symbols, self.dt1, self.dt2):
+            self.put(dt, COUPON, self.on_coupon, code, flow, redeemed)
+
+    def schedule(self, dt1, dt2):
+        """预先载入dt1至dt2（含）之间全部相关品种的价格矩阵，并加入该区间内的每日估值事件以及(dt1, dt2]之间的付息、
+        兑付事件，dt1一般取账户的初始时间"""
+        self.dt1, self.dt2 = dt1, dt2
+        self.prices, dts = self.market.get_price_matrix(self.symbols, dt1, dt2 + dtt.timedelta(1))
+        self.dt_index = {dt: i for i, dt in enumerate(dts)}
+        self.symbol_index = {s: j for j, s in enumerate(self.symbols)}
+        for code, dt, flow, redeemed in self.market.get_paymentdt(self.symbols, dt1, dt2):
+            self.put(dt, COUPON, self.on_coupon, code, flow, redeemed)
+        for dt in dts:
+            self.put(dt, MARK, self.on_mark)
+
+    def price(self, dt, symbol):
+        """从预先载入的价格矩阵中取价，不在矩阵范围内时回退到MarketData逐笔查询"""
+        i = self.dt_index.get(dt)
+        j = self.symbol_index.get(symbol)
+        if i is None or j is None or np.isnan(self.prices[i, j]):
+            return self.market.get_order_price(Order(dt, symbol, 0, True))
+        return self.prices[i, j]
+
+    def on_order(self, dt, order: Order):
+        self.position.fill(order, self.price(dt, order.symbol))
+
+    def on_coupon(self, dt, code, flow, redeemed):
+        # 付息事件对全部相关品种预先排定，只对事件发生时仍持有的债券生效
+        if code in self.position.ps:
+            self.position.receive(code, dt, flow, redeemed)
+
+    def on_mark(self, dt):
+        i = self.dt_index[dt]
+        cash = self.position.cash
+        asset = sum(v * self.prices[i, self.symbol_index[s]] for s, v in self.position.ps.items())
+        return dt, cash, asset, cash + asset
+
+    def run(self):
+        """按时间顺序处理事件队列，每个估值事件输出一条(日期，现金，资产，总值)记录"""
+        while self.queue:
+            dt, _, _, handler, args = heapq.heappop(self.queue)
+            res = handler(dt, *args)
+            if res is not None:
+                yield res
+
+    def get_value(self):
+        """运行全部事件并将逐日输出汇总为与Position.get_value格式相同的DataFrame"""
+        data = list(self.run())
+        index = pd.to_datetime([d[0] for d in data])
+        return pd.DataFrame([d[1:] for d in data], index=index, columns=["cash", "asset", "total"])
@@ -3,12 +3,13 @@
 # 创建日期： 2018/11/14
 # 更新时间：2019/2/21
 
-import pymysql
 import numpy as np
 import pandas as pd
 import datetime as dtt
 import matplotlib.pyplot as plt
 from database import Data
+from pool import ConnectionPool
+import tradedays
 import statsmodels.api as sm
 from pylab import mpl
 from matplotlib.ticker import MultipleLocator, FixedLocator, FixedFormatter
@@ -39,25 +40,8 @@ def imp_select_code(imp: list, cur, column="delta"):
 
 
 def trading_time(dt, minute_delta=5):
-    """生成交易日的交易时间序列，minute_delta是时间间隔，默认为5分钟"""
-    res = []
-    dt_time0 = dtt.datetime(dt.year, dt.month, dt.day, 9, 20, 0)
-    dt_time1 = dtt.datetime(dt.year, dt.month, dt.day, 11, 30, 0)
-    dt_time2 = dtt.datetime(dt.year, dt.month, dt.day, 13, 5, 0)
-    dt_time3 = dtt.datetime(dt.year, dt.month, dt.day, 15, 15, 0)
-    dt_times_am = []
-    dt_times_pm = []
-    dt_time = dt_time0
-    while dt_time <= dt_time1:
-        dt_times_am.append(dt_time)
-        dt_time += dtt.timedelta(minutes=minute_delta)
-    res.extend(dt_times_am)
-    dt_time = dt_time2
-    while dt_time <= dt_time3:
-        dt_times_pm.append(dt_time)
-        dt_time += dtt.timedelta(minutes=minute_delta)
-    res.extend(dt_times_pm)
-    return res
+    """生成交易日的交易时间序列，minute_delta是时间间隔，默认为5分钟，时间网格由tradedays.bars生成"""
+    return tradedays.bars([dt], minute_delta).astype(object).tolist()
 
 
 class ImpSat(object):
@@ -99,7 +83,7 @@ class ImpSat(object):
             for column in ["delta", "dprice"]:
                 sql = r"""select {0} from tb_sec_delta where seq = 0 and {0} is not null and 
                            code0 regexp '[:alnum:]{{2}}{1}.*'""".format(column, bondtype)
-                imp = np.array(Data(sql, self.cur).select_col(0))
+                imp = Data(sql, self.cur).select_array(0)
                 if column == "delta":
                     if bondtype == "00":
                         bins = np.arange(-40, 30, 1)
@@ -159,14 +143,14 @@ class ImpSat(object):
         and t1.delta between -30 and 20
         """
         sql0 = r"select delta from tb_sec_delta where seq = 0 and delta is not null"
-        imp = np.array(Data(sql0, self.cur).select_col(0))
+        imp = Data(sql0, self.cur).select_array(0)
         fig = plt.figure(figsize=(7.2, 9.6))
         plt.subplot(321)
         plt.hist(imp, bins=np.arange(-40, 30, 1), normed=True)
         plt.title("一级发行冲击分布图", fontproperties="SimHei")
         plt.xlabel("发行冲击（bp)", fontproperties="SimHei")
         for i in range(2, 7):
-            data = np.array(Data(sql, self.cur, (i-1,)).data)
+            data = np.column_stack(Data(sql, self.cur, (i-1,)).columns())
             eval("plt.subplot(32{})".format(i))
             X = sm.add_constant(data[:, 0])
             Y = data[:, 1]
@@ -214,8 +198,7 @@ class ImpFuture(object):
         and t1.bondtype = %s and t5.term = %s
         order by t1.delta
         """
-        data = Data(sql1, self.cur, (bond_type, future_term)).data
-        data = pd.DataFrame(np.array(data))
+        data = Data(sql1, self.cur, (bond_type, future_term)).to_frame()
         # 依据delta将data五等分
         n = 5
         res = []
@@ -243,7 +226,7 @@ class ImpFuture(object):
                   on t1.dt = date(t2.dtt) and t2.seq=0
                   where t1.bondtype = %s and t2.term = %s
                   """.format(delta_type)
-        delta = np.array(Data(sql1, self.cur, (bond_type, future_term)).data)
+        delta = Data(sql1, self.cur, (bond_type, future_term)).select_array(0)
         delta = pd.DataFrame(delta, columns=["delta"]).dropna()
         per_delta = [float(delta.min()-1)]
         for p in range(20, 120, 20):
@@ -318,13 +301,17 @@ class ImpFuture(object):
         dt1 = dt0 + dtt.timedelta(days=day1)
         sdt = dt1.strftime("%Y-%m-%d")
         sql1 = """
-        select t1.dt, t1.term, t1.{0}, t2.dt, t3.dt, t1.bondtype
-        from impact t1 inner join dts1 t2 inner join dts1 t3 inner join dts1 t4
-        on t1.dt = t4.dt and t2.seq = t4.seq - %s and t3.seq = t4.seq + %s and t1.bondtype = "{1}"
-        where t1.{0} is not null and t1.dt >= '{2}' 
-        order by t1.{0}
+        select dt, term, {0}, bondtype from impact
+        where {0} is not null and dt >= '{2}' and bondtype = "{1}"
+        order by {0}
         """.format(delta_type, bond_type, sdt)
-        data1 = Data(sql1, self.cur, (day1, day2)).data
+        data1 = Data(sql1, self.cur).data
+        # 发行前day1个与发行后day2个交易日由交易日历（dts1）计算，发行日不是交易日或超出日历范围的记录舍去
+        calendar = tradedays.calendar(self.cur, "dts1")
+        dts = [d[0] for d in data1]
+        dt_start, dt_end = calendar.offsets(dts, -day1), calendar.offsets(dts, day2)
+        data1 = [(d[0], d[1], d[2], a, b, d[3]) for d, a, b in zip(data1, dt_start.astype(object), dt_end.astype(object))
+                 if a is not None and b is not None]
         num = len(data1)  # 提取记录的个数，用于
         print(num)
         # 提取交易行情序列
@@ -398,8 +385,8 @@ class ImpFuture(object):
 def main():
     mpl.rcParams['font.sans-serif'] = ['SimHei']
     plt.rcParams['axes.unicode_minus'] = False
-    db = pymysql.connect("localhost", "root", "root", "strategy1", charset="utf8")
-    cur = db.cursor()
+    pool = ConnectionPool()
+    db = cur = pool.session()
     imp_future = ImpFuture(cur, db)
     # res = imp_future.imp_days("国债", "TF")
     # imp_future.imp_minutes_plot(2, "mg_delta")
@@ -414,6 +401,8 @@ def main():
     #     for r in rs:
     #         print(round(r, 4), end=" ")
     # imp_sat.imp_delta_plot()
+    cur.close()
+    pool.close()
 
 
 if __name__ == "__main__":
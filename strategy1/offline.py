@@ -0,0 +1,170 @@
+# offline.py用SQLite在本地构建与strategy1相同表结构的数据库，并填充模拟数据，用于脱离MySQL与Wind的性能测试
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import re
+import uuid
+import atexit
+import shutil
+import sqlite3
+import tempfile
+import cache
+import numpy as np
+import datetime as dtt
+from database import create_sql
+
+sqlite3.register_adapter(dtt.date, lambda d: d.isoformat())
+sqlite3.register_adapter(dtt.datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("date", lambda b: dtt.date.fromisoformat(b.decode()))
+sqlite3.register_converter("datetime", lambda b: dtt.datetime.fromisoformat(b.decode()))
+
+
+def sqlite_ddl(sql):
+    """将MySQL建表语句转换为SQLite可以执行的形式：去掉字段与表的COMMENT以及ENGINE等表选项"""
+    sql = re.sub(r"COMMENT\s*=?\s*'[^']*'", "", sql, flags=re.I)
+    return sql[:sql.rindex(")") + 1]
+
+
+class SQLiteCursor(object):
+    """以pymysql游标的接口包装sqlite3游标：参数占位符为%s，元组或列表参数展开为(?, ?, ...)，%%还原为%，
+    MySQL的on duplicate key update改写为SQLite的on conflict do update"""
+    def __init__(self, conn: sqlite3.Connection, database_id=None):
+        self.connection = conn
+        self.cur = conn.cursor()
+        self.database_id = database_id or "sqlite:{}".format(uuid.uuid4())  # 查询缓存中区分数据库的标识
+
+    @staticmethod
+    def translate(sql, args):
+        if args is None:
+            args = ()
+        elif not isinstance(args, (tuple, list)):
+            args = (args,)
+        parts = sql.split("%s")
+        if len(parts) - 1 != len(args):
+            raise ValueError("参数个数与占位符个数不一致：{}".format(sql))
+        res = [parts[0]]
+        params = []
+        for arg, part in zip(args, parts[1:]):
+            if isinstance(arg, (tuple, list)):
+                res.append("(" + ", ".join("?" * len(arg)) + ")")
+                params.extend(arg)
+            else:
+                res.append("?")
+                params.append(arg)
+            res.append(part)
+        sql = "".join(res).replace("%%", "%")
+        sql = re.sub(r"on duplicate key update", "on conflict do update set", sql, flags=re.I)
+        sql = re.sub(r"values\((`\w+`)\)", r"excluded.\1", sql, flags=re.I)
+        return sql, params
+
+    def execute(self, sql, args=None):
+        self.cur.execute(*self.translate(sql, args))
+        return self.cur.rowcount
+
+    def executemany(self, sql, args):
+        rowcount = 0
+        for arg in args:
+            rowcount += self.execute(sql, arg)
+        return rowcount
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchmany(self, size=None):
+        return tuple(self.cur.fetchmany(size or self.cur.arraysize))
+
+    def fetchall(self):
+        return tuple(self.cur.fetchall())
+
+    @property
+    def description(self):
+        return self.cur.description
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    def close(self):
+        self.cur.close()
+
+
+def use_temp_cache():
+    """查询缓存目录仍为仓库中的query_cache时，改为本进程专用的临时目录（进程退出时删除），使离线测试与性能测试
+    写入的表版本与缓存不影响实际数据库的缓存"""
+    if cache.CACHE_DIR == cache.DEFAULT_DIR:
+        path = tempfile.mkdtemp(prefix="query_cache_")
+        atexit.register(shutil.rmtree, path, True)
+        cache.set_dir(path)
+
+
+def connect(path=":memory:"):
+    """建立SQLite数据库连接并按create_database的表结构建表，返回连接与pymysql风格的游标。内存数据库的每个连接是
+    不同的数据库，文件数据库以文件路径区分"""
+    use_temp_cache()
+    db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    cur = SQLiteCursor(db, None if path == ":memory:" else "sqlite:" + os.path.abspath(path))
+    for sql in create_sql():
+        cur.execute(sqlite_ddl(sql))
+    db.commit()
+    return db, cur
+
+
+def trading_days(dt1, n):
+    """从dt1开始的n个工作日，作为模拟的交易日序列"""
+    res = []
+    dt = dt1
+    while len(res) < n:
+        if dt.weekday() < 5:
+            res.append(dt)
+        dt += dtt.timedelta(1)
+    return res
+
+
+def fill(db, cur, n_codes=20, n_days=250, n_bars=0, seed=0):
+    """向数据库填充模拟数据：n_codes只首发债及其续发债在n_days个交易日上的估值（tb_sec），对应的发行信息（tb_pri）、
+    付息信息（payment）、发行冲击（impact），国债期货日行情（future）以及前n_bars个交易日的5分钟行情（future_minute）"""
+    rng = np.random.default_rng(seed)
+    dts = trading_days(dtt.date(2013, 1, 4), n_days)
+    cur.executemany("insert into dts1 values (%s, %s)", [(dt, i) for i, dt in enumerate(dts)])
+    cur.executemany("insert into dts2 values (%s, %s)", [(dt, i) for i, dt in enumerate(dts)])
+    terms = [1, 3, 5, 7, 10, 30]
+    tb_sec, tb_pri, payment, impact = [], [], [], []
+    for k in range(n_codes):
+        code0 = "{:02d}00{:02d}.IB".format(10 + k % 8, k // 8 + 1)
+        code = code0[:6] + "X.IB"
+        term = terms[k % len(terms)]
+        rate = round(rng.uniform(2.5, 4.5), 4)
+        freq = 2 if term >= 10 else 1
+        # 发行日期保证债券在模拟区间内不到期
+        dt0 = dtt.date(max(2010 + k % 3, dts[-1].year - term + 1), 1 + k % 12, 1 + k % 28)
+        tb_pri.append((dt0, code0, term, rate, 100, None, None, None, None, "国债", None, None, freq))
+        payment.append((code0, dtt.date(dt0.year + term, dt0.month, dt0.day), rate))
+        ytm = rate + np.cumsum(rng.normal(0, 0.02, n_days))
+        dirty = 100 + np.cumsum(rng.normal(0, 0.1, n_days))
+        for i, dt in enumerate(dts):
+            tb_sec.append((dt, code, code0, term, ytm[i], dirty[i] - 1, dirty[i], i % 128))
+        for dt in rng.choice(dts, size=max(1, n_days // 50), replace=False):
+            impact.append((dt, "{}{}".format(code0[:6], dt.strftime("%y%m%d")), code0, term,
+                           rng.normal(0, 8), rng.normal(0, 8), "国债"))
+    cur.executemany("insert into tb_pri values %s", [(d,) for d in tb_pri])
+    cur.executemany("insert into payment values %s", [(d,) for d in payment])
+    cur.executemany("insert into tb_sec values %s", [(d,) for d in tb_sec])
+    cur.executemany("insert into impact values %s", [(d,) for d in impact])
+    future = []
+    for term in [5, 10]:
+        close = 98 + np.cumsum(rng.normal(0, 0.1, n_days))
+        for i, dt in enumerate(dts):
+            future.append(((dt, 3.0, 3.0, close[i], close[i], term, i),))
+    cur.executemany("insert into future values %s", future)
+    minute = []
+    for dt in dts[:n_bars]:
+        am = dtt.datetime(dt.year, dt.month, dt.day, 9, 20)
+        pm = dtt.datetime(dt.year, dt.month, dt.day, 13, 5)
+        for s in range(54):
+            t = am + dtt.timedelta(minutes=5 * s) if s < 27 else pm + dtt.timedelta(minutes=5 * (s - 27))
+            for term in [5, 10]:
+                minute.append(((t, term, 98 + rng.normal(0, 0.2), None, s),))
+    cur.executemany("insert into future_minute values %s", minute)
+    db.commit()
+    return dts
@@ -0,0 +1,209 @@
+# pool.py为各模块共用的数据库连接池：限制连接总数，借出前检查连接是否可用，断开时自动重连，并为每个线程提供独立的会话
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import time
+import queue
+import threading
+import contextlib
+import pymysql
+
+# 默认的数据库连接参数，与各模块原先的pymysql.connect参数一致
+DEFAULTS = {"host": "localhost", "user": "root", "password": "root", "database": "strategy1", "charset": "utf8"}
+# 连接已断开的MySQL错误代码：2006 MySQL server has gone away，2013 Lost connection during query
+LOST = (2006, 2013)
+
+
+def database_id(cur):
+    """游标所连接数据库的标识，用于区分不同数据库的缓存：pymysql的游标或会话为"mysql://主机:端口/数据库"，其他游标
+    （例如offline.SQLiteCursor）以其database_id属性作为标识"""
+    ident = getattr(cur, "database_id", None)
+    if ident is not None:
+        return ident
+    conn = cur.connection
+    db = conn.db.decode() if isinstance(conn.db, bytes) else conn.db
+    return "mysql://{}:{}/{}".format(conn.host, conn.port, db)
+
+
+class ConnectionPool(object):
+    """线程安全的数据库连接池，最多同时借出size个连接，归还的连接放回空闲队列复用。连接空闲超过ping_interval秒后，
+    借出前先以ping检查并在断开时重连。connect为创建连接的函数，默认以DEFAULTS与kwargs调用pymysql.connect"""
+    def __init__(self, size=4, connect=None, ping_interval=30, timeout=None, **kwargs):
+        self.size = size
+        self.params = dict(DEFAULTS, **kwargs)
+        self.connect = connect or (lambda: pymysql.connect(**self.params))
+        self.ping_interval = ping_interval
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()  # (连接，归还时间)，后进先出以便优先复用最近使用过的连接
+        self.slots = threading.BoundedSemaphore(size)
+        self.stats = {"created": 0, "reused": 0, "reconnected": 0}
+        self.closed = False
+
+    def check(self, conn, idle_since):
+        """检查空闲连接是否可用，pymysql连接以ping(reconnect=True)检查，断开时重新连接，不可恢复时返回None"""
+        if time.monotonic() - idle_since < self.ping_interval or not hasattr(conn, "ping"):
+            return conn
+        try:
+            conn.ping(reconnect=False)
+        except pymysql.err.Error:
+            try:
+                conn.ping(reconnect=True)
+            except pymysql.err.Error:
+                return None
+            self.stats["reconnected"] += 1
+        return conn
+
+    def acquire(self):
+        """借出一个连接，连接数已达上限时等待其他线程归还，超过timeout秒仍无可用连接时抛出异常"""
+        if self.closed:
+            raise ValueError("连接池已关闭")
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError("等待数据库连接超时")
+        try:
+            while True:
+                try:
+                    conn, idle_since = self.idle.get_nowait()
+                except queue.Empty:
+                    conn = self.connect()
+                    self.stats["created"] += 1
+                    return conn
+                conn = self.check(conn, idle_since)
+                if conn is not None:
+                    self.stats["reused"] += 1
+                    return conn
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """归还连接，未提交的事务回滚，broken为True时直接关闭该连接"""
+        try:
+            if broken or self.closed:
+                conn.close()
+            else:
+                conn.rollback()
+                self.idle.put((conn, time.monotonic()))
+        except Exception:
+            pass
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """以with语句借用一个连接，退出时归还"""
+        conn = self.acquire()
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def session(self):
+        """返回一个会话，会话兼具游标与连接的接口，可以直接作为cur与db传给Data、MarketData、ImpSat、Wind2DB等类"""
+        return Session(self)
+
+    def close(self):
+        """关闭全部空闲连接，已借出的连接在归还时关闭"""
+        self.closed = True
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+
+class Session(object):
+    """连接池上的会话：每个线程在第一次执行查询时从连接池借出一个连接并一直持有，直到调用release（或close）归还，
+    因此不同线程可以共用同一个会话对象并发查询。查询语句执行时若发现连接已断开，重连后重新执行一次"""
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.borrowed = {}  # 线程ID->连接
+
+    @property
+    def connection(self):
+        """当前线程持有的连接"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.pool.acquire()
+            self.local.conn = conn
+            self.local.cur = conn.cursor()
+            with self.lock:
+                self.borrowed[threading.get_ident()] = conn
+        return conn
+
+    @property
+    def cur(self):
+        _ = self.connection
+        return self.local.cur
+
+    def cursor(self, *args):
+        """在当前线程的连接上新建游标，例如pymysql.cursors.SSCursor"""
+        return self.connection.cursor(*args)
+
+    def execute(self, sql, args=None):
+        try:
+            return self.cur.execute(sql, args)
+        except pymysql.err.OperationalError as e:
+            # 只对查询语句重试，写入语句重试会丢失断开前未提交的事务
+            if e.args[0] not in LOST or not sql.lstrip().lower().startswith(("select", "show", "with")):
+                raise
+            self.connection.ping(reconnect=True)
+            self.local.cur = self.connection.cursor()
+            self.pool.stats["reconnected"] += 1
+            return self.local.cur.execute(sql, args)
+
+    def executemany(self, sql, args):
+        return self.cur.executemany(sql, args)
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchmany(self, size=None):
+        return self.cur.fetchmany(size) if size else self.cur.fetchmany()
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    @property
+    def description(self):
+        return self.cur.description
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def release(self):
+        """归还当前线程持有的连接，并行任务的线程结束前应调用"""
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            return
+        self.local.cur.close()
+        self.local.conn = self.local.cur = None
+        with self.lock:
+            self.borrowed.pop(threading.get_ident(), None)
+        self.pool.release(conn)
+
+    def close(self):
+        """归还当前线程的连接，其余线程未归还的连接直接关闭"""
+        self.release()
+        with self.lock:
+            borrowed, self.borrowed = self.borrowed, {}
+        for conn in borrowed.values():
+            self.pool.release(conn, broken=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
@@ -0,0 +1,80 @@
+# risk.py用于计算回测持仓的每日利率风险指标：修正久期、DV01与凸性，对全部债券与日期整体向量化计算
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import numpy as np
+import pandas as pd
+import datetime as dtt
+from database import Data, bond_derivatives
+from backtest import MarketData, Position
+
+
+def bond_info(cur, symbols):
+    """从tb_pri中提取首发债的期限、票面利率、发行日期与年付息次数，返回与symbols顺序一致的四个数组"""
+    sql = r"select code, term, rate, dt, pay_times from tb_pri where code in %s"
+    info = {d[0]: d[1:] for d in Data(sql, cur, (list(symbols),)).data}
+    missing = [s for s in symbols if s not in info]
+    if missing:
+        raise ValueError("tb_pri中缺少债券信息：{}".format(missing))
+    term, rate, dt0, freq = zip(*[info[s] for s in symbols])
+    freq = [f or 1 for f in freq]
+    return (np.array(term, dtype=float), np.array(rate, dtype=float), np.array(dt0, dtype="datetime64[D]"),
+            np.array(freq, dtype=int))
+
+
+def bond_risk(term, rate, dt0, freq, dt, ytm, par=100):
+    """批量计算全价、修正久期（年）、每张DV01（元/BP）与凸性，各参数为等长数组或标量，ytm为到期收益率（%），
+    已到期或缺少收益率的记录返回nan"""
+    p, p1, p2, valid = bond_derivatives(term, rate, dt0, freq, dt, ytm, par)
+    freq = np.broadcast_to(freq, p.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        duration = np.where(valid, -p1 / (freq * p), np.nan)
+        dv01 = np.where(valid, -p1 / freq * 1e-4, np.nan)
+        convexity = np.where(valid, p2 / (freq ** 2 * p), np.nan)
+    return np.where(valid, p, np.nan), duration, dv01, convexity
+
+
+class RiskEngine(object):
+    """由账户的日期×品种持仓矩阵与tb_sec中的中债估值收益率计算组合每日的市值、修正久期、DV01与凸性"""
+    def __init__(self, market: MarketData, cur=None):
+        self.market = market
+        self.cur = cur if cur is not None else market.cur
+        self.info = {}  # 品种->(期限，票面利率，发行日期，年付息次数)
+
+    def get_info(self, symbols):
+        """返回symbols的债券信息，只查询一次后缓存"""
+        missing = [s for s in symbols if s not in self.info]
+        if missing:
+            self.info.update(zip(missing, zip(*bond_info(self.cur, missing))))
+        term, rate, dt0, freq = zip(*[self.info[s] for s in symbols])
+        return (np.array(term, dtype=float), np.array(rate, dtype=float), np.array(dt0, dtype="datetime64[D]"),
+                np.array(freq, dtype=int))
+
+    def get_risk(self, position: Position, dt1=None, dt2=None):
+        """计算账户在[dt1, dt2]之间每个交易日的组合风险，默认区间为账本的首末日期。组合久期与凸性按市值加权，
+        DV01为全部持仓之和（元/BP）"""
+        ledger = position.ledger
+        symbols = ledger.symbols
+        dt1 = dt1 or ledger.times[0].astype(object)
+        dt2 = dt2 or ledger.times[ledger.n - 1].astype(object)
+        ytm, dts = self.market.get_price_matrix(symbols, dt1, dt2 + dtt.timedelta(1), field="yield")
+        holdings, _ = position.get_holdings(dts)
+        i, j = np.nonzero(holdings)
+        value = np.zeros((len(dts), len(symbols)))
+        dv01 = np.zeros_like(value)
+        weighted_duration = np.zeros_like(value)
+        weighted_convexity = np.zeros_like(value)
+        if len(i):
+            term, rate, dt0, freq = self.get_info(symbols)
+            dt = np.array(dts, dtype="datetime64[D]")[i]
+            p, d, v, c = bond_risk(term[j], rate[j], dt0[j], freq[j], dt, ytm[i, j])
+            h = holdings[i, j]
+            value[i, j] = h * p
+            dv01[i, j] = h * v
+            weighted_duration[i, j] = h * p * d
+            weighted_convexity[i, j] = h * p * c
+        value = value.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            res = {"value": value, "duration": weighted_duration.sum(axis=1) / value, "dv01": dv01.sum(axis=1),
+                   "convexity": weighted_convexity.sum(axis=1) / value}
+        return pd.DataFrame(res, index=pd.to_datetime(dts), columns=["value", "duration", "dv01", "convexity"])
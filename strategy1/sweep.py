@@ -0,0 +1,97 @@
+# sweep.py用于对发行冲击策略的参数网格进行并行回测
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import shutil
+import itertools
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+from database import Data
+from pool import ConnectionPool
+from backtest import Order, PricePanel, CouponCalendar, MarketData, Position
+
+# 子进程内共享的只读数据，由init_worker在进程启动时载入
+_shared = {}
+
+
+def init_worker(panel_path, calendar, impact):
+    """子进程初始化：以内存映射方式载入价格面板，子进程不再建立数据库连接"""
+    _shared["market"] = MarketData(None, panel=PricePanel.from_file(panel_path), calendar=calendar)
+    _shared["impact"] = impact
+
+
+def impact_orders(market, impact, low, high, hold, bondtype, volume=1000):
+    """发行冲击落在(low, high]区间内的拍卖，在拍卖日买入对应的首发债，持有hold个交易日后卖出，缺少价格的拍卖跳过"""
+    block = market.panel.shared
+    orders = []
+    for dt, code0, delta, btype in impact:
+        if btype != bondtype or delta is None or not low < delta <= high:
+            continue
+        j = block.symbols.get(code0)
+        i = np.searchsorted(block.dts, np.datetime64(dt, "D"))
+        if j is None or i + hold >= len(block.dts) or block.dts[i] != np.datetime64(dt, "D"):
+            continue
+        if np.isnan(block.values[0, i, j]) or np.isnan(block.values[0, i + hold, j]):
+            continue
+        orders.append(Order(dt, code0, volume, True))
+        orders.append(Order(block.dts[i + hold].astype(object), code0, volume, False))
+    # 同一日先卖后买
+    orders.sort(key=lambda o: (o.time, o.is_buy))
+    return orders
+
+
+def run_one(params, cash=1e9):
+    """在子进程中运行单组参数的回测，返回汇总指标"""
+    low, high, hold, bondtype = params
+    market = _shared["market"]
+    orders = impact_orders(market, _shared["impact"], low, high, hold, bondtype)
+    res = {"low": low, "high": high, "hold": hold, "bondtype": bondtype, "orders": len(orders)}
+    if not orders:
+        return res
+    position = Position(cash, {}, orders[0].time, market)
+    position.get_orders(orders)
+    total = position.get_value()["total"]
+    res["pnl"] = total.iloc[-1] - cash
+    res["return"] = 100 * (total.iloc[-1] / cash - 1)
+    res["max_drawdown"] = 100 * (1 - total / total.cummax()).max()
+    return res
+
+
+def sweep(cur, cuts, holds, bondtypes, year1=2013, year2=2019, processes=None, path=None):
+    """并行回测参数网格：cuts为发行冲击的分割点（与imp_select_code相同，首尾各延伸为开区间），holds为持有交易日数，
+    bondtypes为债券类型。价格面板只从数据库读取一次并写入内存映射文件，各子进程只读共享，结果汇总为一张DataFrame。
+    指定path时面板文件保留在path中，否则写入临时目录并在返回前删除"""
+    own = path is None
+    path = path or tempfile.mkdtemp(prefix="panel_")
+    try:
+        PricePanel(cur, max_blocks=None).dump(path, year1, year2)
+        calendar = CouponCalendar(cur)
+        impact = Data("select dt, code0, delta, bondtype from impact order by dt", cur).data
+        bounds = [-np.inf, *cuts, np.inf]
+        grid = [(bounds[i], bounds[i + 1], h, b) for i in range(len(bounds) - 1)
+                for h, b in itertools.product(holds, bondtypes)]
+        with multiprocessing.Pool(processes, initializer=init_worker, initargs=(path, calendar, impact)) as pool:
+            res = pool.map(run_one, grid, chunksize=max(1, len(grid) // (4 * (processes or os.cpu_count()))))
+    finally:
+        # 未指定path时面板写入临时目录，回测结束后删除
+        if own:
+            shutil.rmtree(path, ignore_errors=True)
+    return pd.DataFrame(res)
+
+
+def main():
+    pool = ConnectionPool(size=1)
+    cur = pool.session()
+    try:
+        res = sweep(cur, list(range(-19, 16, 5)), [1, 2, 3, 5], ["国债", "国开债"])
+        print(res)
+    finally:
+        cur.close()
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# test_backtest.py为backtest.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import datetime as dtt
+import numpy as np
+import pytest
+import offline
+from benchmark import rolling_orders
+from database import Data
+from backtest import Ledger, Order, MarketData, Position
+
+
+@pytest.fixture(scope="module")
+def setup():
+    """模拟数据库的游标、滚动买卖指令单与初始时间"""
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes=8, n_days=120)
+    symbols = Data("select distinct code0 from tb_sec order by code0", cur).select_col(0)
+    yield cur, rolling_orders(symbols, dts[1:], hold_days=7, step=5), dts[0]
+    db.close()
+
+
+def full_holdings(ledger):
+    """不使用缓存，由全部持仓变动重新计算的持仓矩阵"""
+    res = np.zeros((ledger.n, len(ledger.symbols)))
+    np.add.at(res, (ledger.event_ids[:ledger.m], ledger.symbol_ids[:ledger.m]), ledger.volumes[:ledger.m])
+    return np.cumsum(res, axis=0)
+
+
+@pytest.mark.parametrize("mode", ["sql", "panel"])
+def test_get_value_matches_loop(setup, mode):
+    cur, orders, time0 = setup
+    position = Position(1e9, {}, time0, MarketData(cur, mode=mode))
+    position.get_orders(orders)
+    res, expected = position.get_value(), position.get_value_loop()
+    expected = expected[~expected.index.duplicated(keep="last")]
+    assert list(res.index) == list(expected.index)
+    np.testing.assert_allclose(res.values, expected.values)
+
+
+def test_holdings_cached_and_incremental():
+    ledger = Ledger(capacity=2)
+    rng = np.random.default_rng(0)
+    time = dtt.date(2020, 1, 1)
+    for i in range(60):
+        deltas = [("S{}".format(j), rng.normal()) for j in rng.choice(i // 6 + 2, size=i % 3, replace=False)]
+        ledger.record(time + dtt.timedelta(i), 0.0, deltas)
+        if i % 7 == 0:
+            np.testing.assert_allclose(ledger.holdings(), full_holdings(ledger))
+    res = ledger.holdings()
+    assert np.shares_memory(ledger.holdings(), res)  # 没有新事件时不重新计算
+    np.testing.assert_allclose(res, full_holdings(ledger))
+    with pytest.raises(ValueError):
+        res[0, 0] = 1
+    restored = Ledger.from_state(ledger.state())
+    np.testing.assert_allclose(restored.holdings(), res)
+
+
+@pytest.mark.parametrize("mode", ["sql", "panel"])
+def test_order_prices_accept_datetimes(setup, mode):
+    cur, orders, _ = setup
+    market = MarketData(cur, mode=mode)
+    mixed = [Order(dtt.datetime.combine(o.time, dtt.time(10, 30)) if k % 2 else o.time, o.symbol, o.volume, o.is_buy)
+             for k, o in enumerate(orders[:40])]
+    mixed[0] = Order(mixed[0].time.isoformat(), mixed[0].symbol, mixed[0].volume, mixed[0].is_buy)
+    expected = [market.get_order_price(o) for o in orders[:40]]
+    np.testing.assert_allclose(market.get_order_prices(mixed), expected)
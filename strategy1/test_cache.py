@@ -0,0 +1,64 @@
+# test_cache.py为cache.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import pytest
+import cache
+import offline
+from cache import QueryCache, bump
+from database import Data
+
+SQL = "select count(*), sum(yield) from tb_sec"
+
+
+@pytest.fixture
+def query_cache(tmp_path, monkeypatch):
+    """使用临时目录的查询缓存"""
+    qc = QueryCache(str(tmp_path))
+    monkeypatch.setattr(Data, "cache", qc)
+    return qc
+
+
+def test_offline_uses_temp_dir():
+    offline.connect()
+    assert cache.CACHE_DIR != cache.DEFAULT_DIR
+
+
+def test_hit_and_invalidation(query_cache):
+    db, cur = offline.connect()
+    offline.fill(db, cur, n_codes=3, n_days=20)
+    first = Data(SQL, cur).data
+    assert Data(SQL, cur).data == first
+    assert query_cache.stats["hits"] == 1
+    cur.execute("delete from tb_sec where code0 = (select min(code0) from tb_sec)")
+    db.commit()
+    assert Data(SQL, cur).data == first  # 未更新表版本时仍返回缓存
+    bump("tb_sec", path=query_cache.path)
+    second = Data(SQL, cur).data
+    assert second != first
+    assert second[0][0] == first[0][0] - 20
+
+
+def test_databases_do_not_share_results(query_cache):
+    db1, cur1 = offline.connect()
+    offline.fill(db1, cur1, n_codes=3, n_days=20)
+    db2, cur2 = offline.connect()
+    offline.fill(db2, cur2, n_codes=5, n_days=20)
+    assert Data(SQL, cur1).data[0][0] == 60
+    assert Data(SQL, cur2).data[0][0] == 100
+    assert query_cache.stats["hits"] == 0
+
+
+def test_evict_only_above_threshold(query_cache, monkeypatch):
+    db, cur = offline.connect()
+    offline.fill(db, cur, n_codes=3, n_days=20)
+    calls = []
+    evict = query_cache.evict
+    monkeypatch.setattr(query_cache, "evict", lambda: calls.append(1) or evict())
+    for k in range(5):
+        Data("select * from tb_sec where seq = %s", cur, k)
+    assert not calls
+    query_cache.max_bytes = query_cache.size() // 2
+    Data("select * from tb_sec where seq = %s", cur, 5)
+    assert calls and query_cache.stats["evictions"] > 0
+    assert query_cache.size() <= query_cache.max_bytes
@@ -0,0 +1,64 @@
+# test_checkpoint.py为checkpoint.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import datetime as dtt
+import numpy as np
+import pytest
+import offline
+from benchmark import rolling_orders
+from database import Data
+from backtest import MarketData, Position
+from checkpoint import WalkForward
+from cost import FixedFee, SpreadByTerm
+
+
+@pytest.fixture(scope="module")
+def setup():
+    """模拟数据库上的行情、滚动买卖指令单与初始时间"""
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes=10, n_days=120)
+    symbols = Data("select distinct code0 from tb_sec order by code0", cur).select_col(0)
+    yield MarketData(cur, mode="panel"), rolling_orders(symbols, dts[1:]), dts[0]
+    db.close()
+
+
+def fresh(market, orders, cash, time0, cost=None):
+    """不使用检查点的完整回测"""
+    position = Position(cash, {}, time0, market, cost)
+    position.get_orders(orders)
+    return position
+
+
+def test_resume_matches_full_run(setup, tmp_path):
+    market, orders, time0 = setup
+    WalkForward(str(tmp_path), market, 1e9, time0, every=20).run(orders[:-15])
+    wf = WalkForward(str(tmp_path), market, 1e9, time0, every=20)
+    position = wf.run(orders)
+    assert wf.stats["resumed_from"] == (len(orders) - 15) // 20 * 20 > 0
+    expected = fresh(market, orders, 1e9, time0)
+    assert position.cash == pytest.approx(expected.cash)
+    np.testing.assert_allclose(position.get_value().values, expected.get_value().values)
+
+
+def test_changed_cash_does_not_resume(setup, tmp_path):
+    market, orders, time0 = setup
+    WalkForward(str(tmp_path), market, 1e9, time0, every=20).run(orders)
+    wf = WalkForward(str(tmp_path), market, 5e8, time0, every=20)
+    position = wf.run(orders)
+    assert wf.stats["resumed_from"] == 0
+    assert position.cash == pytest.approx(fresh(market, orders, 5e8, time0).cash)
+
+
+def test_changed_time0_or_cost_does_not_resume(setup, tmp_path):
+    market, orders, time0 = setup
+    WalkForward(str(tmp_path), market, 1e9, time0, every=20).run(orders)
+    time1 = time0 - dtt.timedelta(1)
+    wf = WalkForward(str(tmp_path), market, 1e9, time1, every=20)
+    wf.run(orders)
+    assert wf.stats["resumed_from"] == 0
+    cost = FixedFee() + SpreadByTerm({5: 0.02})
+    wf = WalkForward(str(tmp_path), market, 1e9, time1, every=20, cost=cost)
+    position = wf.run(orders)
+    assert wf.stats["resumed_from"] == 0
+    assert position.cash == pytest.approx(fresh(market, orders, 1e9, time1, cost).cash)
@@ -0,0 +1,148 @@
+# test_database.py为database.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import warnings
+import datetime as dtt
+import numpy as np
+import pytest
+import scipy.optimize as optimize
+import offline
+from wind import FakeWind
+from database import Data, DB2self, get_freq, get_freqs, BondYTM, get_ts_array, bond_price_array, bond_ytm_array, \
+    p2y_future_array, p2y_future, FUTURE_FLOWS, Excel2DB
+
+
+@pytest.fixture
+def sec():
+    """模拟数据库，续发债在tb_pri中有中标利率与价格，以便计算seq为0的变化"""
+    db, cur = offline.connect()
+    offline.fill(db, cur, n_codes=6, n_days=40)
+    for code, term in Data("select distinct code, term from tb_sec", cur).data:
+        cur.execute("insert into tb_pri(dt, code, term, rate, price, bond_type) values (%s, %s, %s, %s, %s, %s)",
+                    ("2013-01-04", code, term, 3.1, 99.5, "国债"))
+    db.commit()
+    yield db, cur
+    db.close()
+
+
+def delta_reference(cur):
+    """逐只债券、逐个交易日计算的tb_sec_delta，与数据库函数imp_delta、imp_dprice相同"""
+    pri = dict((c, (r, p)) for c, r, p in Data("select code, rate, price from tb_pri", cur).data)
+    rows = Data("select dt, code, code0, term, yield, net, seq from tb_sec order by code, seq", cur).data
+    res, last = {}, {}
+    for dt, code, code0, term, y, net, seq in rows:
+        y0, p0 = pri[code] if seq == 0 else last[code]
+        res[(code, seq)] = (str(dt), code0, term, round(100 * (y0 - y if seq == 0 else y - y0), 2),
+                            round(p0 - net if seq == 0 else net - p0, 4))
+        last[code] = (y, net)
+    return res
+
+
+def stored(cur):
+    rows = Data("select code, seq, dt, code0, term, delta, dprice from tb_sec_delta", cur).data
+    return {(r[0], r[1]): (str(r[2]), *r[3:]) for r in rows}
+
+
+def assert_same(res, expected):
+    assert res.keys() == expected.keys()
+    for k, v in expected.items():
+        assert res[k][:3] == v[:3]
+        assert res[k][3:] == pytest.approx(v[3:], abs=1e-9)
+
+
+def test_tb_sec_delta_matches_reference(sec):
+    db, cur = sec
+    d2s = DB2self(db, cur)
+    assert d2s.insert_tb_sec_delta() == 6
+    assert_same(stored(cur), delta_reference(cur))
+    assert d2s.changed_codes() == []
+
+
+def test_changed_values_are_rebuilt(sec):
+    db, cur = sec
+    d2s = DB2self(db, cur)
+    d2s.insert_tb_sec_delta()
+    code = Data("select min(code) from tb_sec", cur).data[0][0]
+    # 以更新方式同步时估值被原地改写，记录的(code, seq)不变
+    cur.execute("update tb_sec set yield = yield + 0.05 where code = %s and seq = 10", code)
+    db.commit()
+    assert d2s.changed_codes() == [code]
+    assert d2s.insert_tb_sec_delta() == 1
+    assert_same(stored(cur), delta_reference(cur))
+    cur.execute("delete from tb_sec where code = %s and seq = 39", code)
+    db.commit()
+    assert d2s.changed_codes() == [code]
+
+
+def test_get_freqs_uses_client():
+    client = FakeWind()
+    assert get_freqs(["190006.IB", "190010.IB"], client) == [1, 1]
+    assert get_freq("190006.IB", client) == 1
+    assert client.calls == 2
+
+
+BONDS = [(5, 3.2, dtt.date(2013, 3, 15), 1), (10, 3.5, dtt.date(2013, 8, 31), 2), (7, 2.9, dtt.date(2014, 1, 31), 2),
+         (1, 2.5, dtt.date(2015, 11, 30), 1), (3, 3.0, dtt.date(2016, 6, 30), 2), (30, 4.1, dtt.date(2012, 10, 20), 2)]
+
+
+def settle_dates(term, dt0, step=13):
+    """发行日至到期日前每隔step天的结算日"""
+    return [dt0 + dtt.timedelta(k) for k in range(0, int(365 * term) - 2, step)]
+
+
+@pytest.mark.parametrize("term, rate, dt0, freq", BONDS)
+def test_get_ts_matches_loop(term, rate, dt0, freq):
+    bond = BondYTM(term, rate, dt0, freq)
+    dts = settle_dates(term, dt0)
+    t0, n = get_ts_array(term, dt0, freq, dts)
+    for k, dt in enumerate(dts):
+        try:
+            expected = bond.get_ts_loop(dt)
+        except ValueError:
+            continue  # get_ts_loop推算闰年2月29日的次年同日时报错，没有可比较的结果
+        res = bond.get_ts(dt)
+        assert res[0] == pytest.approx(expected[0]) and res[1] == expected[1]
+        assert t0[k] == pytest.approx(expected[0]) and n[k] == len(expected[1])
+
+
+@pytest.mark.parametrize("term, rate, dt0, freq", BONDS)
+def test_bond_arrays_match_bond_ytm(term, rate, dt0, freq):
+    bond = BondYTM(term, rate, dt0, freq)
+    dts = settle_dates(term, dt0, step=29)
+    ytm = np.linspace(1.5, 5.5, len(dts))
+    price = bond_price_array(term, rate, dt0, freq, dts, ytm)
+    np.testing.assert_allclose(price, [bond.bond_price(dt, y) for dt, y in zip(dts, ytm)], rtol=1e-12)
+    res, converged = bond_ytm_array(term, rate, dt0, freq, dts, price)
+    assert converged.all()
+    np.testing.assert_allclose(res, [bond.bond_ytm(dt, p) for dt, p in zip(dts, price)], atol=1e-8)
+    np.testing.assert_allclose(res, ytm, atol=1e-8)
+
+
+@pytest.mark.parametrize("term", [2, 5, 10])
+def test_p2y_future_matches_brentq(term):
+    flows = np.array(FUTURE_FLOWS[term], dtype=float)
+    i = np.arange(1, len(flows) + 1)
+    price = np.array([[92.5, 97.0, 100.0], [np.nan, 101.3, 104.8]])
+    res, converged = p2y_future_array(price, term)
+    assert np.isnan(res[1, 0]) and converged.sum() == 5
+    for p, y in zip(price.ravel()[~np.isnan(price.ravel())], res.ravel()[~np.isnan(res.ravel())]):
+        expected = optimize.brentq(lambda r: (flows * (1 + r) ** -i).sum() - p, -0.5, 1)
+        assert y == pytest.approx(expected, abs=1e-10)
+
+
+def test_excel_read_skips_missing_workbooks(tmp_path, capsys):
+    e2db = Excel2DB(str(tmp_path), None, None, client=FakeWind())
+    assert e2db.read([]) == {}
+    assert e2db.read([("国债", 2026), ("QB补充", 2026)]) == {}
+    assert "2026" in capsys.readouterr().out
+
+
+def test_p2y_future_rejects_implausible_prices():
+    price = np.array([0, -5, 1e-9, np.inf, 1e6, 99.0])
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        res, converged = p2y_future_array(price, 10)
+    assert converged.tolist() == [False] * 5 + [True]
+    assert np.isnan(res[:5]).all() and 0 < res[5] < 0.05
+    assert p2y_future([0.0, 99.0], 10)[0] is None
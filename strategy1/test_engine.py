@@ -0,0 +1,52 @@
+# test_engine.py为engine.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import numpy as np
+import pytest
+import offline
+from benchmark import rolling_orders
+from database import Data
+from backtest import MarketData, Position
+from engine import EventEngine
+
+
+@pytest.fixture(scope="module")
+def setup():
+    """模拟数据库上的行情、滚动买卖指令单与初始时间"""
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes=12, n_days=250)
+    symbols = Data("select distinct code0 from tb_sec order by code0", cur).select_col(0)
+    yield MarketData(cur, mode="panel"), rolling_orders(symbols, dts[1:], hold_days=7, step=5), dts[0]
+    db.close()
+
+
+def reference(market, orders, time0):
+    """以Position.get_orders与get_value计算的账户价值"""
+    position = Position(1e9, {}, time0, market)
+    position.get_orders(orders)
+    return position.get_value()
+
+
+def test_engine_matches_get_value(setup):
+    market, orders, time0 = setup
+    engine = EventEngine(Position(1e9, {}, time0, market), market)
+    engine.add_orders(orders[::-1])  # 加入顺序不影响结果
+    engine.schedule(time0, orders[-1].time)
+    res = engine.get_value()
+    expected = reference(market, orders, time0)
+    assert list(res.index) == list(expected.index)
+    np.testing.assert_allclose(res.values, expected.values)
+
+
+def test_orders_added_after_schedule(setup):
+    market, orders, time0 = setup
+    first = orders[0].symbol
+    early = [o for o in orders if o.symbol == first]
+    late = [o for o in orders if o.symbol != first]
+    engine = EventEngine(Position(1e9, {}, time0, market), market)
+    engine.add_orders(early)
+    engine.schedule(time0, orders[-1].time)
+    engine.add_orders(late)  # 新品种在schedule之后才出现
+    res = engine.get_value()
+    np.testing.assert_allclose(res.values, reference(market, orders, time0).values)
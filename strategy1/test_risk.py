@@ -0,0 +1,66 @@
+# test_risk.py为risk.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import datetime as dtt
+import numpy as np
+import pytest
+import offline
+from benchmark import rolling_orders
+from database import Data, bond_price_array
+from backtest import Order, MarketData, Position
+from risk import RiskEngine, bond_risk
+
+
+@pytest.mark.parametrize("term, rate, dt0, freq", [(5, 3.2, dtt.date(2013, 3, 15), 1),
+                                                   (10, 3.5, dtt.date(2013, 8, 31), 2),
+                                                   (1, 2.5, dtt.date(2015, 11, 30), 1)])
+def test_bond_risk_matches_finite_differences(term, rate, dt0, freq):
+    dt = np.array([dt0 + dtt.timedelta(k) for k in range(0, int(365 * term) - 2, 37)], dtype="datetime64[D]")
+    ytm, h = np.linspace(1.5, 5, len(dt)), 1e-3  # h为收益率的差分步长（%）
+    p, duration, dv01, convexity = bond_risk(term, rate, dt0, freq, dt, ytm)
+    up, down = bond_price_array(term, rate, dt0, freq, dt, ytm + h), bond_price_array(term, rate, dt0, freq, dt, ytm - h)
+    np.testing.assert_allclose(p, bond_price_array(term, rate, dt0, freq, dt, ytm))
+    slope = (up - down) / (2 * h / 100)
+    np.testing.assert_allclose(duration, -slope / p, rtol=1e-6)
+    np.testing.assert_allclose(dv01, -slope * 1e-4, rtol=1e-6)
+    np.testing.assert_allclose(convexity, (up + down - 2 * p) / (h / 100) ** 2 / p, rtol=1e-4)
+
+
+@pytest.fixture(scope="module")
+def setup():
+    """模拟数据库，账户在第10个交易日开始交易，最后仍持有一只债券"""
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes=6, n_days=80)
+    symbols = Data("select distinct code0 from tb_sec order by code0", cur).select_col(0)
+    orders = rolling_orders(symbols, dts[11:-5]) + [Order(dts[-3], symbols[0], 1000, True)]
+    position = Position(1e9, {}, dts[10], MarketData(cur))
+    position.get_orders(orders)
+    yield cur, position, dts
+    db.close()
+
+
+@pytest.mark.parametrize("mode", ["sql", "panel"])
+def test_get_risk(setup, mode):
+    cur, position, dts = setup
+    market = MarketData(cur, mode=mode)
+    risk = RiskEngine(market).get_risk(position, dts[0], dts[-1])
+    assert list(risk.index.date) == dts
+    # 初始时间之前没有持仓
+    assert (risk["value"].iloc[:11] == 0).all() and (risk["dv01"].iloc[:11] == 0).all()
+    assert (risk["dv01"].iloc[-3:] > 0).all()
+    held = risk["value"] > 0
+    assert held.sum() > 20 and risk.loc[held, "duration"].between(0, 30).all()
+    # 与逐日由持仓与bond_risk计算的结果一致
+    engine = RiskEngine(market)
+    symbols = position.ledger.symbols
+    holdings, _ = position.get_holdings(dts)
+    ytm, _ = market.get_price_matrix(symbols, dts[0], dts[-1] + dtt.timedelta(1), field="yield")
+    term, rate, dt0, freq = engine.get_info(symbols)
+    for k in np.flatnonzero(held.values)[::7]:
+        j = np.flatnonzero(holdings[k])
+        p, d, v, c = bond_risk(term[j], rate[j], dt0[j], freq[j], np.datetime64(dts[k]), ytm[k, j])
+        value = (holdings[k, j] * p).sum()
+        assert risk["value"].iloc[k] == pytest.approx(value)
+        assert risk["dv01"].iloc[k] == pytest.approx((holdings[k, j] * v).sum())
+        assert risk["duration"].iloc[k] == pytest.approx((holdings[k, j] * p * d).sum() / value)
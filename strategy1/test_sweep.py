@@ -0,0 +1,21 @@
+# test_sweep.py为sweep.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import os
+import glob
+import tempfile
+import offline
+from sweep import sweep
+
+
+def test_temp_panel_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    db, cur = offline.connect()
+    dts = offline.fill(db, cur, n_codes=5, n_days=60)
+    res = sweep(cur, [0], [1], ["国债"], year1=dts[0].year, year2=dts[-1].year, processes=1)
+    assert res["orders"].sum() > 0
+    assert not glob.glob(os.path.join(str(tmp_path), "panel_*"))
+    kept = str(tmp_path / "kept")
+    sweep(cur, [0], [1], ["国债"], year1=dts[0].year, year2=dts[-1].year, processes=1, path=kept)
+    assert os.listdir(kept)
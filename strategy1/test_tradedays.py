@@ -0,0 +1,41 @@
+# test_tradedays.py为tradedays.py的测试，在offline.py的SQLite模拟数据库上运行
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import datetime as dtt
+import pytest
+import offline
+import tradedays
+
+
+def connect(dts):
+    """交易日表为dts的模拟数据库"""
+    db, cur = offline.connect()
+    for table in ("dts1", "dts2"):
+        cur.executemany("insert into {} values (%s, %s)".format(table), [(dt, i) for i, dt in enumerate(dts)])
+    db.commit()
+    return cur
+
+
+@pytest.fixture
+def cursors():
+    tradedays.reset()
+    d0 = dtt.date(2020, 1, 6)
+    yield connect([d0 + dtt.timedelta(i) for i in range(10)]), connect([d0 + dtt.timedelta(2 * i) for i in range(10)])
+    tradedays.reset()
+
+
+def test_databases_have_own_calendars(cursors):
+    cur1, cur2 = cursors
+    d0 = dtt.date(2020, 1, 6)
+    assert tradedays.calendar(cur1).offset(d0, 3) == dtt.date(2020, 1, 9)
+    assert tradedays.calendar(cur2).offset(d0, 3) == dtt.date(2020, 1, 12)
+    assert tradedays.calendar(cur1) is tradedays.calendar(cur1)
+
+
+def test_reset_drops_table_for_all_databases(cursors):
+    cur1, cur2 = cursors
+    cal1, cal2, other = tradedays.calendar(cur1), tradedays.calendar(cur2), tradedays.calendar(cur1, "dts1")
+    tradedays.reset("dts2")
+    assert tradedays.calendar(cur1) is not cal1 and tradedays.calendar(cur2) is not cal2
+    assert tradedays.calendar(cur1, "dts1") is other
@@ -0,0 +1,103 @@
+# tradedays.py为内存中的交易日历：从dts1（交易所）或dts2（银行间）一次性读入交易日序列，交易日的平移、区间截取与
+# 日内行情时间网格均在内存中以数组计算，不再对每次平移执行自连接查询
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import numpy as np
+import datetime as dtt
+from pool import database_id
+
+# 国债期货5分钟行情的交易时段（含首尾），与future_minute中的时间一致
+SESSIONS = ((dtt.time(9, 20), dtt.time(11, 30)), (dtt.time(13, 5), dtt.time(15, 15)))
+_calendars = {}  # (数据库标识，交易日表)->交易日历
+
+
+class TradingCalendar(object):
+    """交易日历，dts为按先后顺序排列的交易日，交易日在序列中的位置即数据库中的seq"""
+    def __init__(self, dts):
+        self.dts = np.array(dts, dtype="datetime64[D]")
+        self.dates = self.dts.astype(object)
+        self.seqs = {dt: i for i, dt in enumerate(self.dates)}
+
+    @classmethod
+    def load(cls, cur, table="dts2"):
+        """从数据库的交易日表读取交易日历"""
+        if table not in ("dts1", "dts2"):
+            raise ValueError("不被接受的参数值table")
+        _ = cur.execute("select dt from {} order by seq".format(table))
+        return cls([d[0] for d in cur.fetchall()])
+
+    def __len__(self):
+        return len(self.dts)
+
+    def __contains__(self, dt):
+        return dt in self.seqs
+
+    def seq(self, dt):
+        """交易日的顺序号，dt可以是date、datetime或日期字符串"""
+        if type(dt) is not dtt.date:
+            dt = np.datetime64(dt, "D").astype(object)
+        try:
+            return self.seqs[dt]
+        except KeyError:
+            raise ValueError("{}不是交易日".format(dt))
+
+    def offset(self, dt, n: int):
+        """交易日dt之后第n个交易日（n为负数时为之前），与dt_offset的结果相同"""
+        i = self.seq(dt) + n
+        if not 0 <= i < len(self.dates):
+            raise ValueError("{}平移{}个交易日超出了交易日历的范围".format(dt, n))
+        return self.dates[i]
+
+    def offsets(self, dts, n):
+        """offset的向量化版本，dts为日期数组，n为整数或与dts等长的数组，返回datetime64[D]数组，dts不是交易日或
+        平移后超出交易日历范围时为NaT"""
+        dts = np.asarray(dts, dtype="datetime64[D]")
+        res = np.full(dts.shape, np.datetime64("NaT"), dtype="datetime64[D]")
+        if not len(self.dts):
+            return res
+        i = np.searchsorted(self.dts, dts)
+        valid = (i < len(self.dts)) & (self.dts[np.minimum(i, len(self.dts) - 1)] == dts)
+        j = np.broadcast_to(i + np.asarray(n), dts.shape)
+        valid &= (j >= 0) & (j < len(self.dts))
+        res[valid] = self.dts[j[valid]]
+        return res
+
+    def between(self, dt1, dt2):
+        """[dt1, dt2]之间的全部交易日"""
+        a = np.searchsorted(self.dts, np.datetime64(dt1, "D"), side="left")
+        b = np.searchsorted(self.dts, np.datetime64(dt2, "D"), side="right")
+        return self.dts[a:b]
+
+    def window(self, dt, before, after):
+        """交易日dt之前before个交易日至之后after个交易日（含dt）"""
+        i = self.seq(dt)
+        return self.dts[max(i - before, 0):i + after + 1]
+
+
+def bars(dts, minutes=5, sessions=SESSIONS):
+    """生成交易日dts的日内行情时间网格（datetime64[m]数组，按日期与时间排序），各交易时段包含首尾时间，
+    间隔为minutes分钟"""
+    grid = []
+    for start, end in sessions:
+        m0, m1 = start.hour * 60 + start.minute, end.hour * 60 + end.minute
+        grid.append(np.arange(m0, m1 + 1, minutes))
+    grid = np.concatenate(grid).astype("timedelta64[m]")
+    dts = np.asarray(dts, dtype="datetime64[D]").astype("datetime64[m]")
+    return (dts[:, None] + grid).ravel()
+
+
+def calendar(cur, table="dts2"):
+    """读取并缓存交易日历，同一数据库的同一交易日表在进程内只查询一次，不同数据库（例如MySQL与离线SQLite）的
+    交易日历分别缓存"""
+    key = (database_id(cur), table)
+    if key not in _calendars:
+        _calendars[key] = TradingCalendar.load(cur, table)
+    return _calendars[key]
+
+
+def reset(*tables):
+    """交易日表更新后清除各数据库缓存的该表交易日历，不指定表时全部清除"""
+    for key in list(_calendars):
+        if not tables or key[1] in tables:
+            del _calendars[key]
@@ -0,0 +1,160 @@
+# wind.py为Wind数据接口的封装：WindClient调用WindPy，FakeWind在本地生成模拟数据用于离线测试与性能测试，
+# fetch_all以有界线程池并发执行一组请求，失败时按指数退避重试
+# 创建者：季俊男
+# 创建日期：2026/10/18
+
+import time
+import zlib
+import random
+import datetime as dtt
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import tradedays
+
+
+class WindError(Exception):
+    """Wind请求返回非零错误代码"""
+
+
+class WindData(object):
+    """与WindPy返回结果相同结构的数据对象"""
+    def __init__(self, codes, fields, times, data, error_code=0):
+        self.Codes = codes
+        self.Fields = fields
+        self.Times = times
+        self.Data = data
+        self.ErrorCode = error_code
+
+
+class WindClient(object):
+    """Wind接口，方法与WindPy的w对象同名同参，子类可以替换为其他实现"""
+    def __init__(self, w=None):
+        if w is None:
+            from WindPy import w
+        self.w = w
+
+    def start(self):
+        return self.w.start()
+
+    def wsd(self, codes, fields, dt1, dt2, options=""):
+        return self.w.wsd(codes, fields, dt1, dt2, options)
+
+    def wss(self, codes, fields, options=""):
+        return self.w.wss(codes, fields, options)
+
+    def wsi(self, codes, fields, dt1, dt2, options=""):
+        return self.w.wsi(codes, fields, dt1, dt2, options)
+
+    def edb(self, codes, dt1, dt2, options=""):
+        return self.w.edb(codes, dt1, dt2, options)
+
+    def tdays(self, dt1, dt2, options=""):
+        return self.w.tdays(dt1, dt2, options)
+
+
+class FakeWind(WindClient):
+    """本地模拟的Wind接口：交易日为工作日，数值由代码、字段与日期确定，每次请求等待latency秒，并以failure_rate的概率
+    返回错误代码，用于测试重试与并发"""
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def start(self):
+        return WindData([], [], [], [])
+
+    @staticmethod
+    def split(s):
+        return s if isinstance(s, (list, tuple)) else [x.strip() for x in s.split(",") if x.strip()]
+
+    @staticmethod
+    def days(dt1, dt2):
+        """[dt1, dt2]之间的工作日"""
+        days = np.arange(np.datetime64(pd.Timestamp(dt1).date()), np.datetime64(pd.Timestamp(dt2).date()) + 1)
+        return days[np.is_busday(days)]
+
+    @staticmethod
+    def value(code, field, t):
+        """由代码、字段与时间确定的模拟数值，在100附近"""
+        base = zlib.crc32("{}|{}".format(code, field).encode()) % 1000 / 100
+        return 95 + base + 0.01 * (t.toordinal() % 7) + 0.001 * getattr(t, "minute", 0)
+
+    def request(self):
+        """记录一次请求，模拟网络延迟与失败，失败时返回错误对象"""
+        self.calls += 1
+        time.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            return WindData([], [], [], [], error_code=-40520007)
+        return None
+
+    def tdays(self, dt1, dt2, options=""):
+        """与Wind相同，交易日以datetime返回"""
+        days = [dtt.datetime.combine(d, dtt.time()) for d in self.days(dt1, dt2).astype(object)]
+        return WindData([], [], days, [days])
+
+    def wsd(self, codes, fields, dt1, dt2, options=""):
+        error = self.request()
+        if error is not None:
+            return error
+        codes, fields = self.split(codes), self.split(fields)
+        if len(codes) > 1 and len(fields) > 1:
+            return WindData([], [], [], [], error_code=-40522003)  # 与Wind相同，不支持多代码多字段
+        times = self.days(dt1, dt2).astype(object).tolist()
+        data = [[self.value(code, field, t) for t in times] for code in codes for field in fields]
+        return WindData(codes, fields, times, data)
+
+    def edb(self, codes, dt1, dt2, options=""):
+        return self.wsd(codes, "close", dt1, dt2, options)
+
+    def wss(self, codes, fields, options=""):
+        """截面数据，年付息次数（interestfrequency）为1，其余字段为当日的模拟数值"""
+        error = self.request()
+        if error is not None:
+            return error
+        codes, fields = self.split(codes), self.split(fields)
+        today = dtt.date.today()
+        data = [[1 if field == "interestfrequency" else self.value(code, field, today) for code in codes]
+                for field in fields]
+        return WindData(codes, fields, [today], data)
+
+    def wsi(self, codes, fields, dt1, dt2, options=""):
+        error = self.request()
+        if error is not None:
+            return error
+        barsize = int(dict(o.split("=") for o in options.split(";") if "=" in o).get("BarSize", 1))
+        dt1, dt2 = np.datetime64(pd.Timestamp(dt1), "m"), np.datetime64(pd.Timestamp(dt2), "m")
+        times = tradedays.bars(self.days(dt1, dt2), barsize)
+        times = times[(times >= dt1) & (times <= dt2)].astype(object).tolist()
+        fields = self.split(fields)
+        return WindData(self.split(codes), fields, times, [[self.value(codes, f, t) for t in times] for f in fields])
+
+
+def fetch(client, method, *args, retries=3, backoff=0.5):
+    """调用client的method方法，出现异常或错误代码非零时等待backoff * 2 ** k秒后重试，最多重试retries次"""
+    for k in range(retries + 1):
+        try:
+            res = getattr(client, method)(*args)
+            if res.ErrorCode == 0:
+                return res
+            error = WindError("Wind返回错误代码{}：{}{}".format(res.ErrorCode, method, args))
+        except Exception as e:
+            error = e
+        if k < retries:
+            time.sleep(backoff * 2 ** k)
+    raise error
+
+
+def fetch_all(client, requests, workers=4, retries=3, backoff=0.5):
+    """以最多workers个线程并发执行requests中的请求，每个请求为(键，方法名，参数元组)，按完成顺序逐个输出(键，结果)"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, client, method, *args, retries=retries, backoff=backoff): key
+                   for key, method, args in requests}
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            # 出错或提前停止迭代时取消尚未开始的请求
+            for future in futures:
+                future.cancel()